@@ -0,0 +1,91 @@
+"""Replays random edits on JavaScript and HTML views and checks, after
+every edit, that the incrementally updated indexes match ones built from
+scratch.
+
+Edits land anywhere in the buffer, including in the markup between and
+after the scripts, and add or remove script tags, so that the regions
+the JS text is built from change.
+
+    python bench/edit_replay.py [--runs N] [--edits N]
+
+Exits with status 1 when an index differs.
+"""
+
+import random, sys
+
+import harness
+from harness import open_view
+
+SNIPPETS = ["x", "xyz\n", "(", ")", ", ", "{", "}", "[", "]", "'", "\"", "`", "/", "/*",
+            "*/", "//", "\n", "  ", "foo(a, b)", "function f(a) {\n", "g(x) {\n",
+            "h(y)\n", "static\n", "\n{", "<script>", "</script>", "<p>(</p>"]
+
+def random_edit(tern, view, rand):
+  size = view.size()
+  last = view.text.rfind("</script>")
+  if last != -1 and rand.random() < 0.2:
+    # After the last script
+    pos = rand.randint(last + len("</script>"), size)
+  else:
+    pos = rand.randint(0, size)
+  if size and rand.random() < 0.4:
+    end = min(size, pos + rand.randint(1, 5))
+    view.edit(pos, end, "", "left_delete")
+  else:
+    view.edit(pos, pos, rand.choice(SNIPPETS))
+  tern.record_change(view)
+
+def check(tern, view):
+  """Describe how the view's indexes differ from fresh ones, if they do."""
+
+  fresh = tern.JsText()
+  fresh.update(view)
+  text = "".join(gap + piece for gap, piece in fresh.pieces)
+  if tern.view_js_text(view) != text: return "JS text"
+
+  index = tern.BracketIndex()
+  index.update(view.change_count(), text, None)
+  current = tern.call_index(view)
+  if (current.offsets, current.chars) != (index.offsets, index.chars): return "bracket index"
+
+  functions = tern.FunctionIndex()
+  functions.starts, functions.ends, functions.lines, functions.indents = functions.scan(text, 0, len(text))
+  current = tern.function_index(view)
+  if (current.starts, current.ends, current.lines, current.indents) != \
+     (functions.starts, functions.ends, functions.lines, functions.indents): return "function index"
+  return None
+
+def replay(tern, html, seed, edits):
+  rand = random.Random(seed)
+  if html: view = open_view(harness.html_source(4, 8), "/tmp/replay-%d.html" % seed)
+  else: view = open_view(harness.js_source(60, seed), "/tmp/replay-%d.js" % seed)
+  tern.change_log(view)
+  for i in range(edits):
+    random_edit(tern, view, rand)
+    problem = check(tern, view)
+    if problem: return "%s run %d: %s differs after edit %d" % (
+      "HTML" if html else "JS", seed, problem, i + 1)
+  return None
+
+def main(args):
+  runs, edits = (100, 200)
+  while args:
+    flag, value = (args[0], args[1])
+    if flag == "--runs": runs = int(value)
+    elif flag == "--edits": edits = int(value)
+    else: sys.exit(__doc__)
+    args = args[2:]
+
+  tern = harness.load_plugin()
+  problems = []
+  for html in (False, True):
+    for seed in range(runs):
+      problem = replay(tern, html, seed, edits)
+      if problem: problems.append(problem)
+  print("%d runs of %d edits on JS and HTML views" % (runs * 2, edits))
+  for problem in problems: print("FAIL " + problem)
+  if problems: sys.exit(1)
+  print("OK")
+
+if __name__ == "__main__":
+  main(sys.argv[1:])
@@ -0,0 +1,110 @@
+"""Helpers for running the plugin headlessly: loads `tern.py` against the
+stub `sublime` modules, generates synthetic sources and times functions."""
+
+import os, random, shutil, sys, tempfile, time
+
+bench_dir = os.path.dirname(os.path.abspath(__file__))
+root = os.path.dirname(bench_dir)
+sys.path.insert(0, os.path.join(bench_dir, "stubs"))
+sys.path.insert(0, root)
+
+import sublime
+
+timer = getattr(time, "perf_counter", time.time)
+
+def load_plugin(latency=0, completions=100, **settings):
+  """Import the plugin, using the stand-in server as its Tern server."""
+
+  tern_settings = sublime.load_settings("Tern.sublime-settings")
+  tern_settings.values.update({
+    "tern_command": [sys.executable, os.path.join(bench_dir, "stand_in_server.py"),
+                     "--latency", str(latency), "--completions", str(completions)],
+    "tern_output_style": "status",
+    "tern_stats": True,
+  })
+  tern_settings.values.update(settings)
+  import tern
+  tern.plugin_loaded()
+  return tern
+
+def drain(tern, timeout=10, horizon=1):
+  """Run queued callbacks until the plugin's background work is done,
+  waiting for callbacks due within `horizon` seconds."""
+
+  end = time.time() + timeout
+  while time.time() < end:
+    ran = sublime.run_pending()
+    if not ran and tern.executors_idle():
+      due = sublime.next_pending()
+      if not sublime.run_pending() and (due is None or due > time.time() + horizon): return
+    time.sleep(0.001)
+
+def make_project():
+  dir = tempfile.mkdtemp(prefix="tern-bench-")
+  with open(os.path.join(dir, ".tern-project"), "w") as f: f.write("{}")
+  return dir
+
+def remove_project(dir):
+  shutil.rmtree(dir, ignore_errors=True)
+
+def js_source(lines, seed=1):
+  """Synthetic JavaScript of roughly `lines` lines, mixing functions,
+  methods, arrow functions, calls, strings and comments."""
+
+  rand = random.Random(seed)
+  out, n, i = ([], 0, 0)
+  while n < lines:
+    kind = i % 4
+    if kind == 0:
+      out.append("function fn%d(a, b, c) {\n"
+                 "  // call fn%d(a) with \"(\" in a comment\n"
+                 "  var s = \"text ) with parens (\", x = a.map(function (y) { return y * %d; });\n"
+                 "  return helper(a, b, [c, {k: %d}]);\n"
+                 "}\n" % (i, i, rand.randint(1, 9), i))
+      n += 5
+    elif kind == 1:
+      out.append("var obj%d = {\n  method(a, b) {\n    return a + b;\n  },\n"
+                 "  other: function (x) { return x; }\n};\n" % i)
+      n += 6
+    elif kind == 2:
+      out.append("const arrow%d = (a, b) => {\n  return call%d(a, 'str, (', b);\n};\n" % (i, i))
+      n += 3
+    else:
+      out.append("class Klass%d {\n  constructor(x) {\n    this.x = x;\n  }\n"
+                 "  get value() { return this.x; }\n  static make(a) {\n"
+                 "    return new Klass%d(a);\n  }\n}\n" % (i, i))
+      n += 9
+    i += 1
+  return "".join(out)
+
+def html_source(blocks, lines_per_block=20):
+  """HTML with `blocks` script tags separated by markup."""
+
+  out = []
+  for i in range(blocks):
+    out.append("<div class=\"section\">\n  <p>Section %d, with (parens) and \"quotes\"</p>\n</div>\n" % i)
+    out.append("<script>" + js_source(lines_per_block, seed=i) + "</script>\n")
+  return "<html><body>\n" + "".join(out) + "</body></html>\n"
+
+def open_view(text, fname):
+  view = sublime.View(text, fname)
+  sublime.active_window().views().append(view)
+  return view
+
+def measure(fn, setup=None, budget=0.5, min_runs=3, max_runs=2000):
+  """Time `fn`, running `setup` untimed before every call.
+
+  Returns a dict with the number of runs and the mean, median and minimum
+  duration in milliseconds.
+  """
+
+  times = []
+  start = time.time()
+  while len(times) < min_runs or (time.time() - start < budget and len(times) < max_runs):
+    if setup is not None: setup()
+    t = timer()
+    fn()
+    times.append((timer() - t) * 1000)
+  times.sort()
+  return {"runs": len(times), "mean_ms": sum(times) / len(times),
+          "median_ms": times[len(times) // 2], "min_ms": times[0]}
@@ -0,0 +1,237 @@
+"""Headless benchmarks for the plugin's hot paths.
+
+Runs `tern.py` against stub `sublime` modules and a stand-in Tern server
+(see stand_in_server.py), over synthetic JavaScript and HTML buffers.
+
+  python bench/run.py [--sizes 1000,10000,100000] [--latency MS]
+                      [--output FILE] [--compare FILE]
+
+Results are printed as a table and written as JSON, by default to
+bench/results/<version>-<timestamp>.json. Pass an earlier results file to
+--compare to see how the numbers moved.
+"""
+
+import json, os, platform, random, sys, time
+
+import harness
+from harness import drain, measure, open_view
+import sublime
+
+def typing_positions(text, count, seed=2):
+  """Positions just inside calls, used as cursor positions."""
+
+  rand = random.Random(seed)
+  calls = [i + 1 for i in range(len(text)) if text[i] == "("]
+  return [rand.choice(calls) for _ in range(count)]
+
+def modified(tern, view):
+  """Tell the plugin about an edit, like the editor would."""
+
+  if tern.pfile_name(view) in tern.files: tern.Listeners().on_modified(view)
+  else: tern.record_change(view)
+
+def type_char(tern, view, pos, ch="x"):
+  view.edit(pos, pos, ch)
+  modified(tern, view)
+
+def delete_char(tern, view, pos):
+  view.edit(pos, pos + 1, "", "left_delete")
+  modified(tern, view)
+
+def bench_js_text(tern, view, results, label):
+  pos = view.size() // 2
+  def cold():
+    tern.js_texts.pop(view.buffer_id(), None)
+  results.append(dict(name="js_text cold", size=label, **measure(
+    lambda: tern.view_js_text(view), cold)))
+
+  state = {"typed": False}
+  def edit():
+    if state["typed"]: delete_char(tern, view, pos)
+    else: type_char(tern, view, pos)
+    state["typed"] = not state["typed"]
+  tern.view_js_text(view)
+  results.append(dict(name="js_text after edit", size=label, **measure(
+    lambda: tern.view_js_text(view), edit)))
+
+def bench_fragment(tern, view, results, label):
+  positions = typing_positions(view.text, 50)
+  mid = view.size() // 2
+  state = {"typed": False}
+  def edit():
+    if state["typed"]: delete_char(tern, view, mid)
+    else: type_char(tern, view, mid)
+    state["typed"] = not state["typed"]
+  def run():
+    for pos in positions: tern.buffer_fragment(view, pos)
+  tern.function_indexes.pop(view.buffer_id(), None)
+  results.append(dict(name="buffer_fragment cold x50", size=label, **measure(
+    run, lambda: tern.function_indexes.pop(view.buffer_id(), None))))
+  results.append(dict(name="buffer_fragment after edit x50", size=label, **measure(run, edit)))
+
+def bench_locate_call(tern, view, results, label):
+  positions = typing_positions(view.text, 100)
+  def run():
+    for pos in positions:
+      view.sel().clear()
+      view.sel().add(sublime.Region(pos))
+      tern.locate_call(view)
+  results.append(dict(name="locate_call x100", size=label, **measure(run)))
+
+  mid = view.size() // 2
+  state = {"typed": False}
+  def edit():
+    if state["typed"]: delete_char(tern, view, mid)
+    else: type_char(tern, view, mid)
+    state["typed"] = not state["typed"]
+  results.append(dict(name="locate_call after edit x100", size=label, **measure(run, edit)))
+
+def bench_completions(tern, view, results, label):
+  listener = tern.Listeners()
+  pfile = tern.get_pfile(view)
+  pos = typing_positions(view.text, 1)[0]
+  view.edit(pos, pos, "o")
+  tern.record_change(view)
+  view.sel().clear()
+  view.sel().add(sublime.Region(pos + 1))
+  listener.on_query_completions(view, "o", [pos + 1])
+  drain(tern)
+
+  state = {"typed": False}
+  def edit():
+    if state["typed"]: delete_char(tern, view, pos + 1)
+    else: type_char(tern, view, pos + 1, "b")
+    state["typed"] = not state["typed"]
+    del pfile.cached_completions[0].variants[:]
+  def run():
+    at = view.sel()[0].b
+    assert listener.on_query_completions(view, view.substr(view.word(at)), [at]) is not None
+  results.append(dict(name="completions from cache", size=label, **measure(run, edit)))
+  view.edit(pos, pos + 1 + state["typed"], "")
+  tern.record_change(view)
+  drain(tern)
+
+def bench_roundtrip(tern, view, results, label):
+  pos = typing_positions(view.text, 1)[0]
+  def run():
+    assert tern.run_command(view, "type", pos) is not None
+  results.append(dict(name="type query roundtrip", size=label, **measure(run)))
+
+def bench_uploads(tern, view, results, label):
+  """Bytes sent while typing a word with a query after every keystroke,
+  with and without fragment ("part") uploads."""
+
+  pfile = tern.get_pfile(view)
+  pos = typing_positions(view.text, 1)[0]
+  for fragments in (True, False):
+    # Start from a buffer the server has, so only the typing is counted
+    tern.send_buffer(pfile, view)
+    drain(tern)
+    tern.stats.reset()
+    word = "somethingLong"
+    start = time.time()
+    for i, ch in enumerate(word):
+      type_char(tern, view, pos + i, ch)
+      tern.run_command(view, "type", pos + i + 1, fragments=fragments)
+    elapsed = (time.time() - start) * 1000
+    sent = sum(q.bytes_sent for q in tern.stats.queries.values())
+    results.append({"name": "typing, %s uploads" % ("part" if fragments else "full"),
+                    "size": label, "runs": len(word), "mean_ms": elapsed / len(word),
+                    "median_ms": None, "min_ms": None, "bytes_sent": sent})
+    view.edit(pos, pos + len(word), "", "cut")
+    modified(tern, view)
+
+def bench_types(tern, results):
+  from utils import typesig
+  types = ["fn(a: number, b: string) -> bool", "fn(cb: fn(err: ?, data: [string]))",
+           "fn(opts: {x: number, y: number}, ?) -> +Promise[:t=number]",
+           "fn(this: ?, selector: string, context?: Element) -> [+Element]"]
+  types = [t.replace("a:", "a%d:" % i) for i in range(50) for t in types]
+  def run():
+    for t in types: tern.parse_function_type({"type": t})
+  results.append(dict(name="parse_function_type x200", size="-", **measure(
+    run, typesig.cache.clear)))
+  results.append(dict(name="parse_function_type cached x200", size="-", **measure(run)))
+
+def size_label(lines):
+  return "%dk" % (lines // 1000) if lines >= 1000 else str(lines)
+
+def run(sizes, latency):
+  tern = harness.load_plugin(latency=latency)
+  dir = harness.make_project()
+  results = []
+  try:
+    bench_types(tern, results)
+    for lines in sizes:
+      label = size_label(lines)
+      fname = os.path.join(dir, "bench%d.js" % lines)
+      text = harness.js_source(lines)
+      with open(fname, "w") as f: f.write(text)
+      view = open_view(text, fname)
+      view.sel().clear()
+      view.sel().add(sublime.Region(0))
+      bench_js_text(tern, view, results, label)
+      bench_fragment(tern, view, results, label)
+      bench_locate_call(tern, view, results, label)
+      bench_roundtrip(tern, view, results, label)
+      bench_completions(tern, view, results, label)
+      bench_uploads(tern, view, results, label)
+      sys.stderr.write("done with %s lines\n" % label)
+
+    blocks = max(10, sizes[-1] // 1000)
+    view = open_view(harness.html_source(blocks), os.path.join(dir, "page.html"))
+    bench_js_text(tern, view, results, "%d scripts" % blocks)
+  finally:
+    tern.cleanup()
+    harness.remove_project(dir)
+  return results
+
+def package_version():
+  with open(os.path.join(harness.root, "package.json")) as f:
+    return json.load(f).get("version", "unknown")
+
+def print_table(results, baseline=None):
+  base = {}
+  if baseline is not None:
+    for r in baseline["results"]: base[(r["name"], r["size"])] = r
+  print("%-34s %10s %6s %10s %10s %12s%s" % ("benchmark", "size", "runs", "mean", "min",
+                                            "bytes", "   vs. baseline" if base else ""))
+  for r in results:
+    line = "%-34s %10s %6d %8.3fms %10s %12s" % (
+      r["name"], r["size"], r["runs"], r["mean_ms"],
+      "-" if r["min_ms"] is None else "%8.3fms" % r["min_ms"], r.get("bytes_sent", "-"))
+    old = base.get((r["name"], r["size"]), None)
+    if old is not None and old["mean_ms"]:
+      line += "   %+6.1f%%" % ((r["mean_ms"] / old["mean_ms"] - 1) * 100)
+    print(line)
+
+def main(args):
+  sizes, latency, output, compare = ([1000, 10000, 100000], 0, None, None)
+  while args:
+    flag, value = (args[0], args[1])
+    if flag == "--sizes": sizes = [int(s) for s in value.split(",")]
+    elif flag == "--latency": latency = float(value)
+    elif flag == "--output": output = value
+    elif flag == "--compare": compare = value
+    else: sys.exit(__doc__)
+    args = args[2:]
+
+  version = package_version()
+  results = run(sizes, latency)
+  report = {"version": version, "time": time.time(), "python": platform.python_version(),
+            "platform": platform.platform(), "latency_ms": latency, "results": results}
+
+  baseline = None
+  if compare is not None:
+    with open(compare) as f: baseline = json.load(f)
+  print_table(results, baseline)
+
+  if output is None:
+    out_dir = os.path.join(harness.bench_dir, "results")
+    if not os.path.isdir(out_dir): os.makedirs(out_dir)
+    output = os.path.join(out_dir, "%s-%s.json" % (version, time.strftime("%Y%m%d-%H%M%S")))
+  with open(output, "w") as f: json.dump(report, f, indent=2, sort_keys=True)
+  print("\nResults written to " + output)
+
+if __name__ == "__main__":
+  main(sys.argv[1:])
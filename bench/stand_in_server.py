@@ -0,0 +1,114 @@
+"""A stand-in for the Tern server, speaking enough of its protocol for
+benchmarks.
+
+Answers every query with canned data after a configurable delay, with
+`completions` returning a configurable number of entries. Run as a
+script it behaves like `tern`: it prints "Listening on port N" and exits
+when its stdin is closed, so it can be used as `tern_command`.
+
+    python bench/stand_in_server.py [--latency MS] [--completions N]
+"""
+
+import json, sys, threading, time
+
+try:
+  from http.server import HTTPServer, BaseHTTPRequestHandler
+  from socketserver import ThreadingMixIn
+except ImportError:
+  # python 2
+  from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+  from SocketServer import ThreadingMixIn
+
+SIGNATURES = [
+  "fn(callback: fn(elt: ?, i: number, array: +Array) -> bool, context?: ?) -> bool",
+  "fn(start: number, end?: number) -> !this",
+  "fn(type: string, listener: fn(e: +Event), capture: bool)",
+  "fn(selectors: string) -> +Element",
+  "number", "string", "bool", "[number]", "+Element",
+]
+
+
+class Server(ThreadingMixIn, HTTPServer):
+  daemon_threads = True
+
+  def __init__(self, latency=0, completions=100):
+    HTTPServer.__init__(self, ("127.0.0.1", 0), Handler)
+    self.latency = latency / 1000.0
+    self.completions = completions
+    self.requests = []
+    self.files = set()
+
+  @property
+  def port(self):
+    return self.server_address[1]
+
+  def answer(self, doc):
+    for f in doc.get("files", []):
+      if f["type"] == "full": self.files.add(f["name"])
+      elif f["type"] == "delete": self.files.discard(f["name"])
+    query = doc.get("query", None)
+    if query is None: return {}
+    end = query.get("end", 0)
+    if isinstance(end, dict): end = 0
+    type = query["type"]
+    if type == "completions":
+      if query.get("types", False):
+        names = [{"name": "item%05d" % i, "type": SIGNATURES[i % len(SIGNATURES)]}
+                 for i in range(self.completions)]
+      else:
+        names = ["item%05d" % i for i in range(self.completions)]
+      return {"start": end, "end": end, "completions": names}
+    if type == "type":
+      return {"type": SIGNATURES[0], "name": "every", "exprName": "every"}
+    if type == "documentation":
+      return {"type": SIGNATURES[1], "doc": "Returns a section of an array.",
+              "url": "https://developer.mozilla.org/"}
+    if type == "definition":
+      return {"file": query["file"], "start": end, "end": end}
+    if type == "refs":
+      return {"name": "x", "refs": []}
+    if type == "files":
+      return {"files": sorted(self.files)}
+    return {}
+
+
+class Handler(BaseHTTPRequestHandler):
+  protocol_version = "HTTP/1.1"
+
+  def log_message(self, *args):
+    pass
+
+  def do_POST(self):
+    body = self.rfile.read(int(self.headers["Content-Length"]))
+    doc = json.loads(body.decode("utf-8"))
+    self.server.requests.append((doc, len(body)))
+    if self.server.latency: time.sleep(self.server.latency)
+    data = json.dumps(self.server.answer(doc)).encode("utf-8")
+    # Send the head and body in one write, like node does
+    self.wfile.write(("HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                      "Content-Length: %d\r\n\r\n" % len(data)).encode("ascii") + data)
+
+
+def start(latency=0, completions=100):
+  server = Server(latency, completions)
+  thread = threading.Thread(target=server.serve_forever)
+  thread.daemon = True
+  thread.start()
+  return server
+
+
+def main(args):
+  latency, completions = (0, 100)
+  while args:
+    flag, value = (args[0], args[1])
+    if flag == "--latency": latency = float(value)
+    elif flag == "--completions": completions = int(value)
+    args = args[2:]
+  server = start(latency, completions)
+  sys.stdout.write("Listening on port %d\n" % server.port)
+  sys.stdout.flush()
+  sys.stdin.read()
+  server.shutdown()
+
+if __name__ == "__main__":
+  main(sys.argv[1:])
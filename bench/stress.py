@@ -0,0 +1,172 @@
+"""Stress test for the plugin's shared state.
+
+Edits views on the main thread, which stands in for the UI thread, while
+worker threads upload buffers, flush modified files and locate calls the
+way the async thread does, all against the stand-in server. The views
+belong to two projects, one of them a plain directory whose files the
+plugin unloads beyond `tern_max_loaded_files`. Afterwards it checks that:
+
+  - every file the plugin considers in sync was sent at its current
+    change count, and is known to the server;
+  - the incrementally updated JS texts and bracket indexes match ones
+    built from scratch;
+  - queries to different projects ran in parallel.
+
+    python bench/stress.py [--seconds N] [--workers N] [--latency MS]
+
+Exits with status 1 when a check fails.
+"""
+
+import os, random, sys, tempfile, threading, time, traceback
+
+import harness
+from harness import drain, open_view
+import sublime
+
+def make_views(tern, dirs, per_project):
+  views = []
+  for i, dir in enumerate(dirs):
+    for j in range(per_project):
+      fname = os.path.join(dir, "file%d.js" % j)
+      text = harness.js_source(300, seed=i * 10 + j)
+      with open(fname, "w") as f: f.write(text)
+      view = open_view(text, fname)
+      tern.get_pfile(view)
+      views.append(view)
+  return views
+
+def random_edit(tern, view, rand):
+  pos = rand.randint(0, view.size() - 1)
+  if rand.random() < 0.5:
+    view.edit(pos, pos, rand.choice(["x", "(", ")", ", ", "\n", "'", "/*", "*/"]))
+  else:
+    view.edit(pos, pos + 1, "", "left_delete")
+  tern.record_change(view)
+  tern.Listeners().on_modified(view)
+
+def worker(tern, views, stop, errors, seed):
+  rand = random.Random(seed)
+  try:
+    while not stop.is_set():
+      view = rand.choice(views)
+      pfile = tern.files[tern.pfile_name(view)]
+      action = rand.random()
+      if action < 0.3: tern.send_buffer(pfile, view)
+      elif action < 0.5: tern.flush_dirty_files()
+      elif action < 0.6: tern.on_deactivated(view)
+      elif action < 0.8: tern.locate_call(view)
+      else: tern.view_js_text(view)
+      time.sleep(rand.random() * 0.01)
+  except Exception:
+    errors.append(traceback.format_exc())
+
+def stress(tern, views, seconds, workers):
+  stop, errors = (threading.Event(), [])
+  threads = [threading.Thread(target=worker, args=(tern, views, stop, errors, i))
+             for i in range(workers)]
+  for t in threads: t.start()
+  rand, edits, queries = (random.Random(0), 0, 0)
+  end = time.time() + seconds
+  try:
+    while time.time() < end and not errors:
+      view = rand.choice(views)
+      random_edit(tern, view, rand)
+      edits += 1
+      if rand.random() < 0.2:
+        # In a slot, like the plugin's own queries, so that superseded
+        # ones are skipped
+        tern.run_command_async(view, {"type": "type"}, lambda data: None, silent=True,
+                               slot="stress:%d" % view.id())
+        queries += 1
+      sublime.run_pending()
+  finally:
+    stop.set()
+    for t in threads: t.join()
+  drain(tern, timeout=120, horizon=0)
+  return (edits, queries, errors)
+
+def check_state(tern, views):
+  problems = []
+  for view in views:
+    pfile = tern.files[tern.pfile_name(view)]
+    if not pfile.dirty and pfile.synced != view.change_count():
+      problems.append("%s: clean, but synced at %s of %d" %
+                      (view.file_name(), pfile.synced, view.change_count()))
+
+    fresh = tern.JsText()
+    fresh.update(view)
+    text = "".join(gap + piece for gap, piece in fresh.pieces)
+    if tern.view_js_text(view) != text:
+      problems.append("%s: JS text differs from a fresh one" % view.file_name())
+
+    index = tern.BracketIndex()
+    index.update(view.change_count(), text, None)
+    if tern.call_index(view).offsets != index.offsets:
+      problems.append("%s: bracket index differs from a fresh one" % view.file_name())
+
+  checked = set()
+  for view in views:
+    project = tern.files[tern.pfile_name(view)].project
+    if project in checked: continue
+    checked.add(project)
+    known = tern.run_command(view, {"type": "files"}, silent=True)
+    if known is None:
+      problems.append("%s: files query failed" % project.dir)
+      continue
+    for pfile in project.loaded:
+      if not pfile.dirty and tern.relative_file(pfile) not in known["files"]:
+        problems.append("%s: clean, but unknown to the server" % pfile.name)
+  return problems
+
+def check_parallel(tern, views, latency, count=10):
+  """Time `count` queries to each of two projects, submitted at once."""
+
+  by_project = {}
+  for view in views:
+    by_project.setdefault(tern.files[tern.pfile_name(view)].project, view)
+  targets = list(by_project.values())[:2]
+  for view in targets: tern.send_buffer(tern.files[tern.pfile_name(view)], view)
+  drain(tern, horizon=0)
+
+  done = []
+  start = time.time()
+  for i in range(count):
+    for view in targets:
+      tern.run_command_async(view, {"type": "type"}, done.append, silent=True)
+  drain(tern, horizon=0)
+  elapsed = time.time() - start
+  serial = count * len(targets) * latency / 1000.0
+  print("%d queries to %d projects in %.2fs (%.2fs if run one at a time)" %
+        (len(done), len(targets), elapsed, serial))
+  return elapsed < serial * 0.75
+
+def main(args):
+  seconds, workers, latency = (5.0, 4, 20)
+  while args:
+    flag, value = (args[0], args[1])
+    if flag == "--seconds": seconds = float(value)
+    elif flag == "--workers": workers = int(value)
+    elif flag == "--latency": latency = float(value)
+    else: sys.exit(__doc__)
+    args = args[2:]
+
+  tern = harness.load_plugin(latency=latency, tern_max_loaded_files=2)
+  # Only files outside of .tern-project trees are unloaded beyond the limit
+  dirs = [harness.make_project(), tempfile.mkdtemp(prefix="tern-bench-")]
+  try:
+    views = make_views(tern, dirs, 3)
+    edits, queries, errors = stress(tern, views, seconds, workers)
+    print("%d edits and %d queries with %d worker threads" % (edits, queries, workers))
+    problems = ["worker failed:\n" + e for e in errors] + check_state(tern, views)
+    if not check_parallel(tern, views, latency):
+      problems.append("queries to different projects did not run in parallel")
+  finally:
+    tern.cleanup()
+    for dir in dirs: harness.remove_project(dir)
+
+  for problem in problems: print("FAIL " + problem)
+  if problems: sys.exit(1)
+  print("OK")
+
+if __name__ == "__main__":
+  main(sys.argv[1:])
@@ -0,0 +1,296 @@
+"""In-memory stand-in for the `sublime` module, for running the plugin
+outside the editor.
+
+Only the parts of the API the plugin uses are implemented. `.html` views
+expose the contents of their `<script>` tags as `source.js`; other views
+are JavaScript throughout. Timeouts are queued and run by `run_pending`
+once they are due.
+"""
+
+import os
+import re
+import tempfile
+import threading
+import time
+
+_version = "3211"
+
+def version():
+  return _version
+
+def cache_path():
+  return os.path.join(tempfile.gettempdir(), "sublime-stub-cache")
+
+INHIBIT_WORD_COMPLETIONS = 8
+COOPERATE_WITH_AUTO_COMPLETE = 2
+HIDE_ON_MOUSE_MOVE_AWAY = 32
+ENCODED_POSITION = 1
+HOVER_TEXT = 1
+
+
+class Region(object):
+  def __init__(self, a, b=None):
+    if b is None: b = a
+    self.a, self.b = a, b
+
+  def begin(self):
+    return min(self.a, self.b)
+
+  def end(self):
+    return max(self.a, self.b)
+
+  def size(self):
+    return abs(self.b - self.a)
+
+  def empty(self):
+    return self.a == self.b
+
+  def contains(self, pt):
+    return self.begin() <= pt <= self.end()
+
+  def __eq__(self, other):
+    return isinstance(other, Region) and (self.a, self.b) == (other.a, other.b)
+
+  def __ne__(self, other):
+    return not self == other
+
+  def __repr__(self):
+    return "Region(%d, %d)" % (self.a, self.b)
+
+
+class Selection(list):
+  def clear(self):
+    del self[:]
+
+  def add(self, region):
+    self.append(region)
+
+
+class Settings(object):
+  def __init__(self):
+    self.values = {}
+    self.callbacks = {}
+
+  def get(self, key, default=None):
+    return self.values.get(key, default)
+
+  def set(self, key, value):
+    self.values[key] = value
+    for callback in list(self.callbacks.values()): callback()
+
+  def add_on_change(self, key, callback):
+    self.callbacks[key] = callback
+
+  def clear_on_change(self, key):
+    self.callbacks.pop(key, None)
+
+
+_settings = {}
+
+def load_settings(name):
+  return _settings.setdefault(name, Settings())
+
+
+_pending = []
+_pending_lock = threading.Lock()
+
+def set_timeout(callback, delay=0):
+  with _pending_lock:
+    _pending.append((time.time() + delay / 1000.0, callback))
+
+set_timeout_async = set_timeout
+
+def run_pending():
+  """Run the callbacks that are due. Returns how many ran."""
+
+  now = time.time()
+  with _pending_lock:
+    batch = [c for due, c in _pending if due <= now]
+    _pending[:] = [(due, c) for due, c in _pending if due > now]
+  for callback in batch: callback()
+  return len(batch)
+
+def next_pending():
+  """The time the next queued callback is due, or None."""
+
+  with _pending_lock:
+    return min(due for due, c in _pending) if _pending else None
+
+
+messages = []
+
+def status_message(message):
+  messages.append(message)
+
+def error_message(message):
+  messages.append(message)
+
+def ok_cancel_dialog(message, ok_title=""):
+  messages.append(message)
+  return False
+
+
+class Window(object):
+  def __init__(self):
+    self._views = []
+    self.panels = {}
+
+  def views(self):
+    return self._views
+
+  def active_view(self):
+    return self._views[-1] if self._views else None
+
+  def get_output_panel(self, name):
+    if name not in self.panels: self.panels[name] = View("")
+    return self.panels[name]
+
+  create_output_panel = get_output_panel
+
+  def run_command(self, command, args=None):
+    pass
+
+  def open_file(self, fname, flags=0):
+    pass
+
+  def show_quick_panel(self, items, on_select, flags=0, selected_index=-1, on_highlight=None):
+    self.quick_panel = items
+
+  def folders(self):
+    return []
+
+
+_window = Window()
+
+def active_window():
+  return _window
+
+def windows():
+  return [_window]
+
+
+_ids = [0]
+
+class View(object):
+  def __init__(self, text, file_name=None):
+    _ids[0] += 1
+    self._id = _ids[0]
+    self.text = text
+    self._file_name = file_name
+    self._sel = Selection([Region(len(text))])
+    self._change_count = 0
+    self._dirty = False
+    self._settings = Settings()
+    self._js = None
+    self._last_command = "insert"
+    self.popup = None
+
+  def id(self):
+    return self._id
+
+  def buffer_id(self):
+    return self._id
+
+  def file_name(self):
+    return self._file_name
+
+  def size(self):
+    return len(self.text)
+
+  def sel(self):
+    return self._sel
+
+  def window(self):
+    return _window
+
+  def settings(self):
+    return self._settings
+
+  def change_count(self):
+    return self._change_count
+
+  def is_dirty(self):
+    return self._dirty
+
+  def is_loading(self):
+    return False
+
+  def command_history(self, index, modifying_only=False):
+    return (self._last_command, {}, 1)
+
+  def substr(self, x):
+    if isinstance(x, Region): return self.text[x.begin():x.end()]
+    return self.text[x:x + 1]
+
+  def line(self, x):
+    if isinstance(x, Region):
+      a = self.line(x.begin()).a
+      return Region(a, self.line(x.end()).b)
+    a = self.text.rfind("\n", 0, x) + 1
+    b = self.text.find("\n", x)
+    return Region(a, len(self.text) if b == -1 else b)
+
+  def word(self, x):
+    pt = x.begin() if isinstance(x, Region) else x
+    a = b = pt
+    while a > 0 and re.match(r"[\w$]", self.text[a - 1]): a -= 1
+    while b < len(self.text) and re.match(r"[\w$]", self.text[b]): b += 1
+    return Region(a, b)
+
+  def find(self, pattern, start, flags=0):
+    match = re.compile(pattern).search(self.text, start)
+    if match is None: return Region(-1, -1)
+    return Region(match.start(), match.end())
+
+  def js_regions(self):
+    # Keyed by the text, since the plugin reads views from several threads
+    text = self.text
+    if self._js is None or self._js[0] is not text:
+      if self._file_name and self._file_name.endswith(".html"):
+        regions = [Region(m.start(1), m.end(1))
+                   for m in re.finditer(r"<script>(.*?)</script>", text, re.S)]
+      else:
+        regions = [Region(0, len(text))]
+      self._js = (text, regions)
+    return self._js[1]
+
+  def find_by_selector(self, selector):
+    if selector == "source.js": return list(self.js_regions())
+    return []
+
+  def score_selector(self, pt, selector):
+    if selector == "source.js":
+      return 1 if any(r.a <= pt <= r.b for r in self.js_regions()) else 0
+    return 0
+
+  def match_selector(self, pt, selector):
+    return self.score_selector(pt, selector) > 0
+
+  def rowcol(self, pt):
+    return (self.text.count("\n", 0, pt), pt - self.text.rfind("\n", 0, pt) - 1)
+
+  def is_popup_visible(self):
+    return self.popup is not None
+
+  def show_popup(self, content, flags=0, location=-1, max_width=320, max_height=240,
+                 on_navigate=None, on_hide=None):
+    self.popup = content
+
+  def update_popup(self, content):
+    self.popup = content
+
+  def hide_popup(self):
+    self.popup = None
+
+  def run_command(self, command, args=None):
+    if command == "tern_arghint": self.text = (args or {}).get("msg", "")
+
+  def edit(self, a, b, text, command="insert"):
+    """Replace the text between `a` and `b`, leaving the cursor after it."""
+
+    self.text = self.text[:a] + text + self.text[b:]
+    self._change_count += 1
+    self._dirty = True
+    self._js = None
+    self._last_command = command
+    self._sel = Selection([Region(a + len(text))])
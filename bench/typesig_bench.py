@@ -0,0 +1,87 @@
+"""Micro-benchmark for the Tern type-signature parser.
+
+Parses every `!type` signature found in Tern's `ecmascript` and `browser`
+defs (from `node_modules/tern/defs`, after `npm install`), or a built-in
+sample of them, repeatedly through the uncached and cached parsers.
+
+    python bench/typesig_bench.py [rounds]
+"""
+
+import json, os, sys, time
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root)
+
+from utils.typesig import parse_signature, parse_type, cache
+
+SAMPLE = [
+  "fn(value: ?) -> bool",
+  "fn(callback: fn(elt: ?, i: number, array: +Array) -> bool, context?: ?) -> bool",
+  "fn(callback: fn(elt: ?, i: number, array: +Array), context?: ?)",
+  "fn(compare?: fn(a: ?, b: ?) -> number) -> !this",
+  "fn(start: number, end?: number) -> !this",
+  "fn(separator?: string) -> string",
+  "fn(pattern: string|+RegExp, replacement: string) -> string",
+  "fn(text: string, reviver?: fn(key: string, value: ?) -> ?) -> ?",
+  "fn(value: ?, replacer?: fn(key: string, value: ?) -> ?, space?: string|number) -> string",
+  "fn(x: number, y: number) -> number",
+  "fn(obj: ?, prop: string, desc: ?) -> !custom:Object_defineProperty",
+  "fn(proto: ?, properties?: ?) -> !custom:Object_create",
+  "fn(thisArg: ?, args?: [?]) -> !0.!ret",
+  "fn(type: string, listener: fn(e: +Event), capture: bool)",
+  "fn(selectors: string) -> +Element",
+  "fn(tagName: string) -> +Element",
+  "fn(id: string) -> +Element",
+  "fn(code: fn(), ms: number) -> number",
+  "fn(url: string, name?: string, specs?: string, replace?: bool) -> +Window",
+  "fn(message: string)",
+  "fn(name: string, value: string)",
+  "fn(x: number, y: number, w: number, h: number)",
+  "fn(x: number, y: number, radius: number, startAngle: number, endAngle: number, anticlockwise?: bool)",
+  "fn(image: ?, dx: number, dy: number)",
+  "fn(sw: number, sh: number) -> +ImageData",
+  "fn(node: +Element, deep: bool) -> +Element",
+  "fn(resolve: fn(value: ?), reject: fn(reason: ?))",
+  "fn(onFulfilled: fn(value: ?), onRejected: fn(reason: ?)) -> +Promise",
+  "fn(iterable: [?]) -> +Promise",
+  "fn() -> number",
+  "fn()",
+]
+
+def collect(node, out):
+  if isinstance(node, dict):
+    for key, value in node.items():
+      if key == "!type" and isinstance(value, str) and value.startswith("fn("):
+        out.append(value)
+      else:
+        collect(value, out)
+  return out
+
+def load_corpus():
+  defs = os.path.join(root, "node_modules", "tern", "defs")
+  corpus = []
+  for name in ("ecmascript.json", "browser.json"):
+    path = os.path.join(defs, name)
+    if os.path.isfile(path):
+      with open(path) as f: collect(json.load(f), corpus)
+  return (corpus, "defs") if corpus else (SAMPLE, "built-in sample")
+
+def timed(fn, corpus, rounds):
+  start = time.time()
+  for _ in range(rounds):
+    for type in corpus: fn(type)
+  return time.time() - start
+
+def main():
+  rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+  corpus, source = load_corpus()
+  cache.clear()
+  uncached = timed(parse_signature, corpus, rounds)
+  cached = timed(parse_type, corpus, rounds)
+  calls = len(corpus) * rounds
+  print("%d signatures (%s), %d rounds" % (len(corpus), source, rounds))
+  print("uncached: %8.2f us/parse" % (uncached / calls * 1e6))
+  print("cached:   %8.2f us/parse" % (cached / calls * 1e6))
+
+if __name__ == "__main__":
+  main()
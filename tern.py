@@ -2,40 +2,125 @@
 
 import sublime, sublime_plugin
 import os, sys, platform, subprocess, webbrowser, json, re, time, atexit
+import bisect, socket, threading, hashlib, collections
 from subprocess import CalledProcessError
 try:
   # python 2
-  from utils.renderer import create_renderer
+  from utils.renderer import create_renderer, get_description_message, go_to_url
+  from utils.lru import LRUCache
+  from utils.diskcache import DiskCache
+  from utils.symbols import SymbolIndex
+  from utils.changes import ChangeLog
+  from utils.executor import QueryExecutor
+  from utils.typesig import parse_type
+  from utils.stats import Stats
+  from utils.brackets import BracketIndex
+  from utils.health import ServerHealth
 except:
-  from .utils.renderer import create_renderer
+  from .utils.renderer import create_renderer, get_description_message, go_to_url
+  from .utils.lru import LRUCache
+  from .utils.diskcache import DiskCache
+  from .utils.symbols import SymbolIndex
+  from .utils.changes import ChangeLog
+  from .utils.executor import QueryExecutor
+  from .utils.typesig import parse_type
+  from .utils.stats import Stats
+  from .utils.brackets import BracketIndex
+  from .utils.health import ServerHealth
 
 windows = platform.system() == "Windows"
 python3 = sys.version_info[0] > 2
+if python3: unichr = chr
 is_st2 = int(sublime.version()) < 3000
 
 def is_js_file(view):
   return len(view.sel()) > 0 and view.score_selector(sel_end(view.sel()[0]), "source.js") > 0
 
 files = {}
+change_logs = {}
+# Guards the per-buffer caches, which are used from the UI and async threads
+buffer_lock = threading.RLock()
+def dispatch(f):
+  sublime.set_timeout(f, 0)
+stats = Stats()
 arghints_enabled = False
+hover_enabled = False
 renderer = None
+output_style = None
 arg_completion_enabled = False
 tern_command = None
 tern_arguments = []
+tern_version = None
+
+def set_timeout_async(callback, delay):
+  if is_st2: sublime.set_timeout(callback, delay)
+  else: sublime.set_timeout_async(callback, delay)
+
+def on_activated(view):
+  pfile = get_pfile(view)
+  if pfile is not None: prewarm_server(pfile.project)
 
 def on_deactivated(view):
-  pfile = files.get(view.file_name(), None)
+  pfile = files.get(pfile_name(view), None)
   if pfile and pfile.dirty:
-    send_buffer(pfile, view)
+    # Take the project's other files that are waiting to be flushed along
+    entries = [(pfile, view)]
+    with flush_lock:
+      for other, other_view in list(dirty_files.items()):
+        if other.project is pfile.project:
+          del dirty_files[other]
+          if other is not pfile: entries.append((other, other_view))
+    send_buffers([entries[0]] + [(f, v) for f, v in entries[1:] if worth_flushing(f, v)])
+
+# Selection changes wait this many milliseconds for the cursor to settle
+# before argument hints are updated
+ARGHINT_DELAY = 50
+# View id -> the time of the selection change argument hints wait for
+pending_arghints = {}
 
 def on_selection_modified(view):
   if not arghints_enabled: return
+  stamp = pending_arghints[view.id()] = time.time()
+  set_timeout_async(lambda: selection_settled(view, stamp), ARGHINT_DELAY)
+
+def selection_settled(view, stamp):
+  if pending_arghints.get(view.id(), None) != stamp: return
+  del pending_arghints[view.id()]
   pfile = get_pfile(view)
-  if pfile is not None: show_argument_hints(pfile, view)
+  if pfile is None: return
+  sel = view.sel()[0]
+  state = (view.change_count(), sel.a, sel.b)
+  if state == pfile.arghints_state: return
+  pfile.arghints_state = state
+  show_argument_hints(pfile, view)
 
 class Listeners(sublime_plugin.EventListener):
   def on_close(self, view):
-    files.pop(view.file_name(), None)
+    with files_lock: pfile = files.pop(pfile_name(view), None)
+    if pfile is not None:
+      unload_file(pfile)
+      with flush_lock: dirty_files.pop(pfile, None)
+    with buffer_lock:
+      change_logs.pop(view.buffer_id(), None)
+      js_texts.pop(view.buffer_id(), None)
+      function_indexes.pop(view.buffer_id(), None)
+      call_indexes.pop(view.buffer_id(), None)
+    pending_arghints.pop(view.id(), None)
+    pending_hovers.pop(view.id(), None)
+
+  def on_post_save(self, view):
+    fname = view.file_name()
+    if fname is not None and os.path.basename(fname) == ".tern-project":
+      tern_project_changed(fname)
+    # An unsaved view that was saved under a real name
+    with files_lock: pfile = files.pop(untitled_name(view), None)
+    if pfile is not None: unload_file(pfile)
+
+  def on_activated(self, view):
+    if is_st2: on_activated(view)
+
+  def on_activated_async(self, view):
+    on_activated(view)
 
   def on_deactivated(self, view):
     if is_st2: on_deactivated(view)
@@ -44,12 +129,17 @@ class Listeners(sublime_plugin.EventListener):
     on_deactivated(view)
 
   def on_modified(self, view):
-    pfile = files.get(view.file_name(), None)
-    if pfile: pfile_modified(pfile, view)
+    pfile = files.get(pfile_name(view), None)
+    if pfile:
+      if not exact_changes: record_change(view)
+      pfile_modified(pfile, view)
 
   def on_selection_modified(self, view):
     if is_st2: on_selection_modified(view)
 
+  def on_hover(self, view, point, hover_zone):
+    if hover_enabled and hover_zone == sublime.HOVER_TEXT: show_hover(view, point)
+
   def on_selection_modified_async(self, view):
     on_selection_modified(view)
 
@@ -100,14 +190,13 @@ class Listeners(sublime_plugin.EventListener):
     pfile = get_pfile(view)
     if pfile is None: return None
 
-    completions, fresh = ensure_completions_cached(pfile, view)
-    if completions is None: return None
+    cached = ensure_completions_cached(pfile, view)
+    if cached is None: return None
+    clist, typed = cached
 
-    if not fresh:
-      completions = [c for c in completions if c[1].startswith(prefix)]
-
-    completions = [postfixQuotes(c) for c in completions]
-    completions = [postfixPathes(c) for c in completions]
+    context = (typed, prefix, prevQuote, nextQuote, pathPrefix, pathLastQuote)
+    completions = clist.variant(context, lambda completions:
+      [postfixPathes(postfixQuotes(c)) for c in completions])
 
     flags = 0;
     if get_setting("tern_inhibit_word_completions", False):
@@ -115,87 +204,261 @@ class Listeners(sublime_plugin.EventListener):
 
     return (completions, flags)
 
+# Edits that only touch the text around the cursor(s), so that the
+# changed range can be derived from the selection. Snippets and
+# completions, which may expand to several lines and leave the cursor
+# inside them, are not among them.
+LOCAL_EDIT_COMMANDS = ("insert", "left_delete", "right_delete", "delete_word", "paste", "cut")
+
+exact_changes = hasattr(sublime_plugin, "TextChangeListener")
+
+if exact_changes:
+  class TextChangeListener(sublime_plugin.TextChangeListener):
+    @classmethod
+    def is_applicable(cls, buffer):
+      return True
+
+    def on_text_changed(self, changes):
+      log = change_logs.get(self.buffer.id(), None)
+      if log is None: return
+      count = self.buffer.primary_view().change_count()
+      with buffer_lock:
+        for change in changes:
+          start = change.a.pt
+          log.record(count, start, start + len(change.str),
+                     len(change.str) - (change.b.pt - start))
+
+def change_log(view):
+  with buffer_lock:
+    log = change_logs.get(view.buffer_id(), None)
+    if log is None:
+      log = change_logs[view.buffer_id()] = ChangeLog(view.change_count(), view.size())
+    return log
+
+# Approximate the edited range from the selection when the editor does not
+# report text changes.
+def record_change(view):
+  with buffer_lock:
+    log = change_log(view)
+    count, size = (view.change_count(), view.size())
+    if count <= log.base: return
+    if view.command_history(0, True)[0] not in LOCAL_EDIT_COMMANDS:
+      log.reset(count, size)
+      return
+    delta = size - log.size
+    start, end = (size, 0)
+    for sel in view.sel():
+      line = view.line(sel)
+      start = min(start, line.a, sel_start(sel) - max(delta, 0))
+      end = max(end, line.b)
+    log.record(count, max(0, start), end, delta)
+
+def changed_span(pfile, view):
+  """The range edited since the server last got the full text, or None."""
+
+  if pfile.synced is None: return None
+  with buffer_lock: return change_log(view).span_since(pfile.synced, view.change_count())
+
 class ProjectFile(object):
   def __init__(self, name, view, project):
     self.project = project
     self.name = name
-    self.dirty = view.is_dirty()
-    self.cached_completions = None
+    # Saved files of a project with a .tern-project file, as opposed to
+    # unsaved buffers and files opened from elsewhere
+    self.in_project = view.file_name() is not None and \
+      os.path.isfile(os.path.join(project.dir, ".tern-project"))
+    self.dirty = view.is_dirty() or not is_pure_js(view)
+    # Change count of the buffer text the server has, if known
+    self.synced = None if self.dirty else view.change_count()
+    self.cached_completions = []
+    self.pending_completions = None
     self.cached_arguments = None
     self.showing_arguments = False
+    # (change count, selection) argument hints were last updated for
+    self.arghints_state = None
+    # (change count, hash) of the buffer's JS text
+    self.content_hash = None
     self.last_modified = 0
 
 class Project(object):
+  """A project and the state of its server.
+
+  `lock` guards the state of the project and its files that is shared
+  between the UI thread, the async thread and the project's `executor`,
+  which sends the project's queries independently of other projects.
+  """
+
   def __init__(self, dir):
     self.dir = dir
+    self.lock = threading.RLock()
+    # Jobs return `(data, error)` tuples, like `send_request`
+    self.executor = QueryExecutor(dispatch, lambda e: (None, str(e)))
     self.port = None
     self.proc = None
-    self.last_failed = 0
+    self.starting = None
+    self.started = 0
+    self.last_used = 0
+    self.failures = 0
+    self.next_start = 0
+    self.crashed = False
     self.disabled = False
+    self.connections = ConnectionPool()
+    self.health = ServerHealth()
+    # Files the server has seen, least recently used first
+    self.loaded = []
+    # Names of files to delete from the server with the next request
+    self.pending_deletes = []
+    # Query results, valid while `generation` is unchanged
+    self.results = LRUCache(200)
+    self.generation = 0
+    self.disk_cache = None
+    self.symbols = SymbolIndex()
 
   def __del__(self):
     kill_server(self)
 
 
+def untitled_name(view):
+  return os.path.join(os.path.dirname(__file__), get_setting("tern_default_project_dir", "default_project_dir"),
+                      "untitled-%d.js" % view.id())
+
+def pfile_name(view):
+  """The name of the view's file, or a made-up one that stays the same
+  for as long as an unsaved view is open."""
+
+  fname = view.file_name()
+  if fname is None: fname = untitled_name(view)
+  return fname
+
 def get_pfile(view):
   if not is_js_file(view): return None
-  fname = view.file_name()
-  if fname is None:
-    fname = os.path.join(os.path.dirname(__file__), get_setting("tern_default_project_dir", "default_project_dir"), str(time.time()))
-  if fname in files:
-    pfile = files[fname]
+  fname = pfile_name(view)
+  pfile = files.get(fname, None)
+  if pfile is not None:
     if pfile.project.disabled: return None
     return pfile
 
   pdir = project_dir(fname)
   if pdir is None: return None
 
-  project = None
-  for f in files.values():
-    if f.project.dir == pdir:
-      project = f.project
-      break
-  if project is None: project = Project(pdir)
-  pfile = files[fname] = ProjectFile(fname, view, project)
+  with files_lock:
+    project = projects.get(pdir, None)
+    if project is None: project = projects[pdir] = Project(pdir)
+    change_log(view)
+    pfile = files.get(fname, None)
+    if pfile is None: pfile = files[fname] = ProjectFile(fname, view, project)
   if project.disabled: return None
   return pfile
 
+# Guards adding to `files` and `projects`
+files_lock = threading.Lock()
+# Projects by root directory
+projects = {}
+# Directory -> (the directory of the closest .tern-project at or above it,
+# or None when there is none, the time it was looked up)
+project_roots = {}
+# Seconds after which directories without a .tern-project are looked at
+# again, for files created outside of the editor
+PROJECT_ROOT_RECHECK = 5
+
 def project_dir(fname):
   dir = os.path.dirname(fname)
-  if not os.path.isdir(dir): return None
+  if dir not in project_roots and not os.path.isdir(dir): return None
 
-  cur = dir
+  cur, root, visited, now = (dir, None, [], time.time())
   while True:
+    if cur in project_roots:
+      root, checked = project_roots[cur]
+      if root is not None and not os.path.isfile(os.path.join(root, ".tern-project")):
+        # The .tern-project file was removed
+        project_roots.clear()
+        return project_dir(fname)
+      if root is not None or now - checked < PROJECT_ROOT_RECHECK: break
     parent = os.path.dirname(cur[:-1])
     if not parent:
       break
+    visited.append(cur)
     if os.path.isfile(os.path.join(cur, ".tern-project")):
-      return cur
+      root = cur
+      break
     cur = parent
-  return dir
+  for d in visited: project_roots[d] = (root, now)
+  return root or dir
 
-def pfile_modified(pfile, view):
-  pfile.dirty = True
-  now = time.time()
-  if now - pfile.last_modified > .5:
-    pfile.last_modified = now
-    if is_st2:
-      sublime.set_timeout(lambda: maybe_save_pfile(pfile, view, now), 5000)
-    else:
-      sublime.set_timeout_async(lambda: maybe_save_pfile(pfile, view, now), 5000)
-  if pfile.cached_completions and sel_start(view.sel()[0]) < pfile.cached_completions[0]:
-    pfile.cached_completions = None
-  if pfile.cached_arguments and sel_start(view.sel()[0]) < pfile.cached_arguments[0]:
-    pfile.cached_arguments = None
+def tern_project_changed(fname):
+  """Forget the project roots of the directories below a .tern-project file
+  that was created or removed."""
 
-def maybe_save_pfile(pfile, view, timestamp):
-  if pfile.last_modified == timestamp and pfile.dirty:
-    send_buffer(pfile, view)
+  dir = os.path.dirname(fname)
+  for d in list(project_roots.keys()):
+    if d == dir or d.startswith(os.path.join(dir, "")): del project_roots[d]
+
+def pfile_modified(pfile, view):
+  pos = sel_start(view.sel()[0])
+  with pfile.project.lock:
+    pfile.dirty = True
+    project_changed(pfile.project)
+    pfile.last_modified = time.time()
+    if pfile.cached_completions:
+      pfile.cached_completions = [c for c in pfile.cached_completions if c.start <= pos]
+    if pfile.cached_arguments and pos < pfile.cached_arguments[0]:
+      pfile.cached_arguments = None
+  with flush_lock:
+    dirty_files[pfile] = view
+    schedule_flush(FLUSH_DELAY)
+
+# Modified files are sent to the server once they have not been edited
+# for this many milliseconds
+FLUSH_DELAY = 5000
+# Modified files waiting to be sent, with their views
+dirty_files = {}
+flush_scheduled = False
+# Guards `dirty_files` and `flush_scheduled`
+flush_lock = threading.RLock()
+
+def schedule_flush(delay):
+  global flush_scheduled
+  with flush_lock:
+    if flush_scheduled: return
+    flush_scheduled = True
+  set_timeout_async(flush_dirty_files, int(delay))
+
+def flush_dirty_files():
+  """Send the modified files that have been left alone for `FLUSH_DELAY`,
+  and schedule the next flush for the others."""
+
+  global flush_scheduled
+  now, due, wait = (time.time(), [], None)
+  with flush_lock:
+    flush_scheduled = False
+    for pfile, view in list(dirty_files.items()):
+      idle = (now - pfile.last_modified) * 1000
+      if idle < FLUSH_DELAY:
+        wait = min(wait or FLUSH_DELAY, FLUSH_DELAY - idle)
+        continue
+      del dirty_files[pfile]
+      due.append((pfile, view))
+  send_buffers([(pfile, view) for pfile, view in due if pfile.dirty and worth_flushing(pfile, view)])
+  if wait is not None: schedule_flush(wait)
+
+def worth_flushing(pfile, view):
+  # Big buffers whose changes fit in a single query fragment are left
+  # alone; queries send those changes as "part" files.
+  if view.size() > 8000:
+    span = changed_span(pfile, view)
+    if span is not None and span[1] - span[0] <= 2000: return False
+  return True
 
 def server_port(project, ignored=None):
+  """Find the port of the project's server, starting it if needed.
+
+  Waits for a starting server to report its port, so this must not be
+  called on the UI thread. Returns a `(port, port_is_old)` tuple.
+  """
+
   if project.port is not None and project.port != ignored:
     return (project.port, True)
-  if project.port == ignored:
+  if project.port is not None and project.port == ignored:
     kill_server(project)
 
   port_file = os.path.join(project.dir, ".tern-port")
@@ -205,53 +468,395 @@ def server_port(project, ignored=None):
       project.port = port
       return (port, True)
 
-  started = start_server(project)
-  if started is not None:
-    project.port = started
-  return (started, False)
+  starting = start_server(project)
+  if starting is not None: starting.wait(30)
+  return (project.port, False)
+
+server_lock = threading.Lock()
+# Projects with a running server, least recently used first
+servers = []
 
 def start_server(project):
+  """Start the project's server in the background, unless it is running or
+  waiting out a restart delay. Returns an event set once the server has
+  reported its port or failed to start, or None."""
+
   global tern_command
-  if not tern_command: return None
-  if time.time() - project.last_failed < 30: return None
-  env = None
-  if platform.system() == "Darwin":
-    env = os.environ.copy()
-    env["PATH"] += ":/usr/local/bin"
-
-  if not isinstance(tern_command, list):
-    tern_command = [tern_command]
-
-  proc = subprocess.Popen(tern_command + tern_arguments, cwd=project.dir, env=env,
-                          stdin=subprocess.PIPE, stdout=subprocess.PIPE,
-                          stderr=subprocess.STDOUT, shell=windows)
-  output = ""
+  if project.starting is not None: return project.starting
+  if project.proc is not None or not tern_command: return None
+  if time.time() < project.next_start: return None
+  enforce_server_budget(project)
+
+  with server_lock:
+    if project.starting is not None: return project.starting
+    if project.proc is not None: return None
+    env = None
+    if platform.system() == "Darwin":
+      env = os.environ.copy()
+      env["PATH"] += ":/usr/local/bin"
+
+    if not isinstance(tern_command, list):
+      tern_command = [tern_command]
 
+    try:
+      proc = subprocess.Popen(tern_command + tern_arguments, cwd=project.dir, env=env,
+                              stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                              stderr=subprocess.STDOUT, shell=windows)
+    except (IOError, OSError) as e:
+      server_failed(project, str(e))
+      return None
+    project.proc = proc
+    project.started = project.last_used = time.time()
+    project.crashed = False
+    servers.append(project)
+    starting = project.starting = threading.Event()
+  reader = threading.Thread(target=read_server_output, args=(project, proc, starting))
+  reader.daemon = True
+  reader.start()
+  return starting
+
+def read_server_output(project, proc, starting):
+  output = ""
   while True:
     line = proc.stdout.readline().decode("utf-8")
-    if not line:
-      sublime.error_message("Failed to start server" + (output and ":\n" + output))
-      project.last_failed = time.time()
-      return None
+    if not line: break
+    if starting is None: continue
     match = re.match("Listening on port (\\d+)", line)
     if match:
-      project.proc = proc
-      return int(match.group(1))
+      with server_lock:
+        project.port = int(match.group(1))
+        project.starting = None
+      starting.set()
+      starting = None
+      sublime.set_timeout(lambda: warm_up(project, proc), 0)
     else:
       output += line
+  proc.wait()
+  server_exited(project, proc, starting is not None and output)
+  if starting is not None: starting.set()
+
+def server_exited(project, proc, output):
+  with server_lock:
+    if project.proc is not proc: return
+    servers.remove(project)
+    project.proc = None
+    project.port = None
+    project.starting = None
+    project.connections.close()
+    forget_loaded_files(project)
+    if time.time() - project.started > 60: project.failures = 0
+  server_failed(project, output)
+
+def server_failed(project, output):
+  """Delay the next start of a failed or crashed server, backing off
+  exponentially on repeated failures."""
+
+  project.crashed = True
+  project.failures += 1
+  project.next_start = time.time() + min(60, 2 ** (project.failures - 1))
+  if project.failures == 1 and output is not False:
+    log_error("failed to start server" + (output and ":\n" + output))
 
 def kill_server(project):
-  if project.proc is None: return
-  project.proc.stdin.close()
-  project.proc.wait()
-  project.proc = None
+  project.connections.close()
+  with server_lock:
+    proc = project.proc
+    if proc is not None: servers.remove(project)
+    project.proc = None
+    project.port = None
+    project.starting = None
+    project.crashed = False
+    forget_loaded_files(project)
+  if proc is None: return
+  proc.stdin.close()
+  proc.wait()
+
+def forget_loaded_files(project):
+  """Note that the server is gone, and with it the files it had."""
+
+  with project.lock:
+    for pfile in project.loaded: pfile.dirty, pfile.synced = (True, None)
+    project.loaded = []
+    project.pending_deletes = []
+
+def touch_server(project):
+  project.last_used = time.time()
+  with server_lock:
+    if project in servers:
+      servers.remove(project)
+      servers.append(project)
+
+def enforce_server_budget(starting):
+  """Shut down the least recently used servers so that starting one more
+  stays within `tern_max_servers`."""
+
+  limit = get_setting("tern_max_servers", 0)
+  if not limit: return
+  while True:
+    with server_lock:
+      running = [p for p in servers if p is not starting]
+      if len(running) < limit: return
+      victim = running[0]
+    kill_server(victim)
+
+def evict_idle_servers():
+  timeout = get_setting("tern_server_idle_timeout", 0)
+  if not timeout: return
+  now = time.time()
+  for project in list(servers):
+    if now - project.last_used > timeout: kill_server(project)
+
+def server_rss(pid):
+  """Resident memory of a process in kilobytes, or None if unknown."""
+
+  try:
+    if os.path.isfile("/proc/%d/status" % pid):
+      for line in open("/proc/%d/status" % pid):
+        if line.startswith("VmRSS:"): return int(line.split()[1])
+    elif not windows and hasattr(subprocess, "check_output"):
+      return int(subprocess.check_output(["ps", "-o", "rss=", "-p", str(pid)]))
+  except (IOError, OSError, ValueError, CalledProcessError):
+    pass
+  return None
+
+def server_info():
+  """Describe the running servers, least recently used first."""
+
+  info = []
+  for project in list(servers):
+    proc = project.proc
+    if proc is None: continue
+    info.append({"dir": project.dir, "pid": proc.pid, "port": project.port,
+                 "rss": server_rss(proc.pid), "last_used": project.last_used,
+                 "health": project.health.describe()})
+  return info
+
+def check_servers():
+  """Restart crashed servers that are due, shut down idle ones, and
+  schedule the next check."""
+
+  try:
+    evict_idle_servers()
+    for project in all_projects():
+      if project.disabled: continue
+      # Read once, as other threads clear it when the server goes away
+      proc = project.proc
+      if proc is not None and proc.poll() is not None:
+        server_exited(project, proc, False)
+      elif project.crashed:
+        start_server(project)
+  finally:
+    set_timeout_async(check_servers, 5000)
+
+def prewarm_server(project):
+  """Start the server ahead of the first query."""
+
+  if project.port is None and not project.disabled and \
+     not os.path.isfile(os.path.join(project.dir, ".tern-port")):
+    start_server(project)
+
+# Warm-up uploads are sent in batches of about this many characters
+WARM_UP_BATCH = 256 * 1024
+
+def warm_up(project, proc):
+  """Send a freshly started server the project's open buffers and the
+  files matched by its `loadEagerly` patterns, so that the first queries
+  don't wait for them to be loaded."""
+
+  if not get_setting("tern_warm_up", False) or project.proc is not proc: return
+  names = set()
+  for window in sublime.windows():
+    for view in window.views():
+      pfile = files.get(pfile_name(view), None)
+      if pfile is None or pfile.project is not project: continue
+      if pfile.dirty: send_buffer(pfile, view)
+      elif os.path.isfile(pfile.name): names.add(pfile.name)
+  thread = threading.Thread(target=warm_up_files, args=(project, proc, names))
+  thread.daemon = True
+  thread.start()
+
+def warm_up_files(project, proc, names):
+  names = sorted(names.union(eager_files(project.dir)))
+  batch, size, sent = ([], 0, 0)
+  for i, fname in enumerate(names):
+    try:
+      with open(fname, "rb") as f: text = f.read().decode("utf-8", "replace")
+    except (IOError, OSError):
+      continue
+    batch.append({"type": "full", "name": fname[len(project.dir) + 1:], "text": text})
+    size += len(text)
+    if size < WARM_UP_BATCH and i < len(names) - 1: continue
+    # Let interactive queries go first
+    while not project.executor.idle():
+      if project.proc is not proc: return
+      time.sleep(.05)
+    if project.proc is not proc: return
+    send_request(project, {"files": batch})
+    sent += len(batch)
+    status = "Tern: warmed up %d of %d files" % (sent, len(names))
+    sublime.set_timeout(lambda: sublime.status_message(status), 0)
+    batch, size = ([], 0)
+    time.sleep(.05)
+
+def eager_files(dir):
+  """The files matched by the `loadEagerly` patterns of the project's
+  .tern-project file."""
+
+  try:
+    with open(os.path.join(dir, ".tern-project"), "r") as f: config = json.load(f)
+    patterns = config.get("loadEagerly", None) or []
+  except (IOError, OSError, ValueError, AttributeError):
+    return []
+  found = set()
+  for pattern in patterns:
+    if os.path.isabs(pattern): continue
+    regex = re.compile(glob_to_regex(pattern) + "$")
+    # Only walk the part of the tree below the pattern's literal prefix
+    parts = pattern.split("/")
+    base = dir
+    while len(parts) > 1 and not re.search("[*?\\[]", parts[0]):
+      base = os.path.join(base, parts.pop(0))
+    for root, dirs, names in os.walk(base):
+      dirs[:] = [d for d in dirs if not d.startswith(".")]
+      for name in names:
+        path = os.path.join(root, name)
+        if regex.match(path[len(dir) + 1:].replace(os.sep, "/")): found.add(path)
+  return found
+
+def glob_to_regex(pattern):
+  regex, pos = ("", 0)
+  while pos < len(pattern):
+    if pattern.startswith("**/", pos):
+      regex += "(?:.*/)?"
+      pos += 3
+    elif pattern.startswith("**", pos):
+      regex += ".*"
+      pos += 2
+    else:
+      ch = pattern[pos]
+      if ch == "*": regex += "[^/]*"
+      elif ch == "?": regex += "[^/]"
+      else: regex += re.escape(ch)
+      pos += 1
+  return regex
+
+def all_projects():
+  """The projects with open files."""
+
+  return set(f.project for f in list(files.values()))
 
 def relative_file(pfile):
   return pfile.name[len(pfile.project.dir) + 1:]
 
+# Function keywords, arrows and method heads (`name(args) {` at the start
+# of a line) that can open a fragment.
+FUNCTION_START = re.compile(r"\bfunction\b|=>|^[ \t]*(?:(?:static|async|get|set)\s+|\*\s*)*"
+                            r"(?!(?:if|for|while|switch|catch|with|function|return)\b)"
+                            r"[\w$]+\s*\([^()\n]*\)\s*\{", re.M)
+
+# What a method head can start with, up to a line break it runs on past
+HEAD_PREFIX = re.compile(r"[ \t]*(?:(?:static|async|get|set)\s+|\*\s*)*(?:[\w$]+\s*(?:\([^()\n]*\)\s*)?)?\Z")
+# Non-blank lines looked back over for the start of such a head
+HEAD_LINES = 6
+
+class FunctionIndex(object):
+  """Offsets of the function starts in a buffer, with their indentation.
+
+  `starts` and `ends` hold the match ranges, `lines` and `indents` the
+  start offset and indentation of the line each match is on. `regions`
+  is the `js_layout` of the indexed text.
+  """
+
+  def __init__(self):
+    self.count = None
+    self.regions = None
+    self.starts, self.ends, self.lines, self.indents = ([], [], [], [])
+
+  def add(self, entries, text, m):
+    line = text.rfind("\n", 0, m.start()) + 1
+    entries[0].append(m.start())
+    entries[1].append(m.end())
+    entries[2].append(line)
+    entries[3].append(count_indentation(text[line:m.end()]))
+
+  def scan(self, text, a, b):
+    entries = ([], [], [], [])
+    for m in FUNCTION_START.finditer(text, a, b): self.add(entries, text, m)
+    return entries
+
+  def head_start(self, text, pos):
+    """The earliest line start before `pos`, itself a line start, from
+    which a method head could run on past `pos`, or `pos` if none."""
+
+    start, line, seen = (pos, pos, 0)
+    while line > 0 and seen < HEAD_LINES:
+      end, line = (line, text.rfind("\n", 0, line - 1) + 1)
+      if not text[line:end].strip(): continue
+      seen += 1
+      if HEAD_PREFIX.match(text, line, pos): start = line
+    return start
+
+  def rescan(self, text, span):
+    """Rescan `text` around the `(start, end, delta)` span edited since the
+    indexed version. Returns the new entries, and the range they replace
+    the old ones in."""
+
+    start, end, delta = span
+    # Back up to a line start that no match, old or new, runs on past
+    pos = text.rfind("\n", 0, start) + 1
+    while True:
+      pos = self.head_start(text, pos)
+      i = bisect.bisect_left(self.starts, pos)
+      if i == 0 or self.ends[i - 1] <= pos: break
+      pos = self.lines[i - 1]
+
+    # Scan on to a line start past the edit that no match runs on past,
+    # from where the old entries hold again, shifted by `delta`
+    entries, matches = (([], [], [], []), FUNCTION_START.finditer(text, pos))
+    m, reached = (next(matches, None), end)
+    while True:
+      stop = text.find("\n", reached)
+      stop = len(text) if stop == -1 else stop + 1
+      if m is not None and m.start() < stop:
+        self.add(entries, text, m)
+        reached = max(reached, m.end())
+        m = next(matches, None)
+        continue
+      if stop == len(text): break
+      j = bisect.bisect_left(self.starts, stop - delta)
+      if j == 0 or self.ends[j - 1] <= stop - delta: break
+      reached = self.ends[j - 1] + delta
+    return (entries, bisect.bisect_left(self.starts, pos), bisect.bisect_left(self.starts, stop - delta))
+
+  def update(self, view):
+    count, text, layout = (view.change_count(), view_js_text(view), js_layout(view))
+    span = None
+    if self.count is not None: span = js_edit_span(view, self.count, count, self.regions, layout)
+    if span is None:
+      self.starts, self.ends, self.lines, self.indents = self.scan(text, 0, len(text))
+    else:
+      scanned, before, after = self.rescan(text, span)
+      delta, old = (span[2], (self.starts, self.ends, self.lines, self.indents))
+      new = []
+      for i in range(3):
+        new.append(old[i][:before] + scanned[i] + [x + delta for x in old[i][after:]])
+      new.append(old[3][:before] + scanned[3] + old[3][after:])
+      self.starts, self.ends, self.lines, self.indents = new
+    self.regions = layout
+    self.count = count if view.change_count() == count else None
+
+function_indexes = {}
+
+def function_index(view):
+  with buffer_lock:
+    index = function_indexes.get(view.buffer_id(), None)
+    if index is None: index = function_indexes[view.buffer_id()] = FunctionIndex()
+    if index.count != view.change_count(): index.update(view)
+    return index
+
 def buffer_fragment(view, pos):
   region = None
-  for js_region in view.find_by_selector("source.js"):
+  for js_region in js_regions(view):
     if js_region.a <= pos and js_region.b >= pos:
       region = js_region
       break
@@ -259,18 +864,19 @@ def buffer_fragment(view, pos):
 
   start = view.line(max(region.a, pos - 1000)).a
   if start < pos - 1500: start = pos - 1500
-  cur = start
+  # Pick the least indented function start between `start` and `pos`
+  index = function_index(view)
+  i = bisect.bisect_left(index.starts, start)
   min_indent = 10000
-  while True:
-    next = view.find("\\bfunction\\b", cur)
-    if next is None or next.b > pos or (next.a == -1 and next.b == -1): break
-    line = view.line(next.a)
-    if line.a < pos - 1500: line = sublime.Region(pos - 1500, line.b)
-    indent = count_indentation(view.substr(line))
+  while i < len(index.starts) and index.ends[i] <= pos:
+    line, indent = (index.lines[i], index.indents[i])
+    if line < pos - 1500:
+      line = pos - 1500
+      indent = count_indentation(view.substr(sublime.Region(line, index.ends[i])))
     if indent < min_indent:
       min_indent = indent
-      start = line.a
-    cur = line.b
+      start = line
+    i += 1
   return sublime.Region(start, min(pos + 500, region.b))
 
 def count_indentation(line):
@@ -296,116 +902,529 @@ class Req_Error(Exception):
 
 localhost = (windows and "127.0.0.1") or "localhost"
 
-def make_request_py2():
-  import urllib2
-  opener = urllib2.build_opener(urllib2.ProxyHandler({}))
-  def f(port, doc):
-    try:
-      req = opener.open("http://" + localhost + ":" + str(port) + "/", json.dumps(doc), 1)
-      return json.loads(req.read())
-    except urllib2.HTTPError as error:
-      raise Req_Error(error.read())
-  return f
-
-def make_request_py3():
-  import urllib.request, urllib.error
-  opener = urllib.request.build_opener(urllib.request.ProxyHandler({}))
-  def f(port, doc):
-    try:
-      req = opener.open("http://" + localhost + ":" + str(port) + "/", json.dumps(doc).encode("utf-8"), 1)
-      return json.loads(req.read().decode("utf-8"))
-    except urllib.error.URLError as error:
-      if hasattr(error, "read"):
-        raise Req_Error(error.read().decode("utf-8"))
-      else:
-        raise error
-  return f
-
 if python3:
-  make_request = make_request_py3()
+  import http.client as httplib
 else:
-  make_request = make_request_py2()
+  import httplib
 
-def view_js_text(view):
-  text, pos = ("", 0)
-  for region in view.find_by_selector("source.js"):
-    if region.a > pos: text += ";" + re.sub(r'[^\n]', " ", view.substr(sublime.Region(pos + 1, region.a)))
-    text += view.substr(region)
-    pos = region.b
-  return text
+class ConnectionPool(object):
+  """Persistent keep-alive HTTP connections to a project's Tern server.
 
-def run_command(view, query, pos=None, fragments=True, silent=False):
-  """Run the query on the Tern server.
+  Idle connections are reused across requests, and dropped when the
+  server's port changes. `last_timing` holds the (connect, roundtrip)
+  times, in seconds, of the most recent request.
+  """
 
-  See default queries at http://ternjs.net/doc/manual.html#protocol.
+  def __init__(self, size=4):
+    self.port = None
+    self.idle = []
+    self.size = size
+    self.lock = threading.Lock()
+    self.last_timing = (0, 0)
+
+  def acquire(self, port, timeout):
+    with self.lock:
+      if port != self.port:
+        self.close_idle()
+        self.port = port
+      if self.idle:
+        conn = self.idle.pop()
+        conn.timeout = timeout
+        if conn.sock is not None: conn.sock.settimeout(timeout)
+        return (conn, True)
+    return (httplib.HTTPConnection(localhost, port, timeout=timeout), False)
+
+  def release(self, port, conn):
+    with self.lock:
+      if port == self.port and len(self.idle) < self.size:
+        self.idle.append(conn)
+        return
+    conn.close()
+
+  def close_idle(self):
+    for conn in self.idle: conn.close()
+    self.idle = []
+
+  def close(self):
+    with self.lock:
+      self.close_idle()
+      self.port = None
+
+  def request(self, port, doc, timeout=1):
+    body = json.dumps(doc)
+    if python3: body = body.encode("utf-8")
+    while True:
+      conn, reused = self.acquire(port, timeout)
+      start = time.time()
+      try:
+        connect_time = 0
+        if conn.sock is None:
+          conn.connect()
+          connect_time = time.time() - start
+        conn.request("POST", "/", body, {"Content-Type": "application/json"})
+        resp = conn.getresponse()
+        data = resp.read()
+      except socket.timeout:
+        conn.close()
+        stats.record_error(request_type(doc))
+        raise
+      except (httplib.HTTPException, socket.error):
+        conn.close()
+        # A reused connection may have been closed by a restarted server
+        if reused: continue
+        stats.record_error(request_type(doc))
+        raise
+      self.last_timing = (connect_time, time.time() - start)
+      if stats.enabled:
+        stats.record_request(request_type(doc), [f["type"] for f in doc.get("files", [])],
+                             connect_time, self.last_timing[1], len(body), len(data))
+      if resp.will_close: conn.close()
+      else: self.release(port, conn)
+      if python3: data = data.decode("utf-8")
+      if resp.status >= 300: raise Req_Error(data)
+      return json.loads(data)
+
+def request_type(doc):
+  query = doc.get("query", None)
+  return query["type"] if query else "upload"
+
+def make_request(project, port, doc):
+  return project.connections.request(port, doc, project.health.timeout(request_type(doc)))
+
+class JsText(object):
+  """The `source.js` regions of a buffer and the text built from them.
+
+  `pieces` holds, per region, the blanked-out gap before it and its text.
   """
 
+  def __init__(self):
+    self.count = None
+    self.regions = []
+    self.pieces = []
+    self.text = None
+
+  def update(self, view):
+    count = view.change_count()
+    span = None
+    if self.count is not None: span = change_log(view).span_since(self.count, count)
+    if span is None: start, end, delta = (view.size(), 0, 0)
+    else: start, end, delta = span
+
+    # Pieces of text that lie wholly before or after the edited span are
+    # taken over from the previous version.
+    old, pos = ({}, 0)
+    if span is not None:
+      for region, piece in zip(self.regions, self.pieces):
+        old[(pos, region.a, region.b)] = piece
+        pos = region.b
+    def reuse(pos, a, b):
+      if b <= start: return old.get((pos, a, b), None)
+      if pos >= end: return old.get((pos - delta, a - delta, b - delta), None)
+      return None
+
+    regions = view.find_by_selector("source.js")
+    pieces, pos = ([], 0)
+    for region in regions:
+      piece = reuse(pos, region.a, region.b)
+      if piece is None:
+        gap = ""
+        if region.a > pos: gap = ";" + re.sub(r'[^\n]', " ", view.substr(sublime.Region(pos + 1, region.a)))
+        piece = (gap, view.substr(region))
+      pieces.append(piece)
+      pos = region.b
+    # Edited meanwhile on another thread: the regions may be newer than
+    # `count`, so the next update must not reuse them
+    if view.change_count() != count: count = None
+    self.count, self.regions, self.pieces, self.text = (count, regions, pieces, None)
+
+js_texts = {}
+
+def js_text(view):
+  with buffer_lock:
+    cached = js_texts.get(view.buffer_id(), None)
+    if cached is None: cached = js_texts[view.buffer_id()] = JsText()
+    if cached.count != view.change_count(): cached.update(view)
+    return cached
+
+def js_regions(view):
+  return js_text(view).regions
+
+def is_pure_js(view):
+  regions = js_regions(view)
+  return len(regions) == 1 and regions[0].a == 0 and regions[0].b == view.size()
+
+def view_js_text(view):
+  with buffer_lock:
+    cached = js_text(view)
+    if cached.text is None:
+      parts = []
+      for gap, text in cached.pieces:
+        parts.append(gap)
+        parts.append(text)
+      cached.text = "".join(parts)
+    return cached.text
+
+def js_layout(view):
+  """The `source.js` regions the JS text is built from, as tuples."""
+
+  return [(r.a, r.b) for r in js_text(view).regions]
+
+def js_edit_span(view, count, until, old_layout, layout):
+  """The `(start, end, delta)` span of the JS text edited between change
+  counts `count` and `until`, given the `js_layout` of both versions.
+
+  JS text offsets are buffer offsets, since the text between regions is
+  blanked out rather than left out, but the text ends with the last
+  region. Returns None when an index of the text must be rebuilt: when
+  the edits are unknown, or when the regions changed other than by being
+  moved or resized by the edit.
+  """
+
+  span = change_log(view).span_since(count, until)
+  if span is None or old_layout is None: return None
+  start, end, delta = span
+  old_end, moved = (end - delta, [])
+  for a, b in old_layout:
+    if b < start: moved.append((a, b))
+    elif a > old_end: moved.append((a + delta, b + delta))
+    elif a <= start and b >= old_end: moved.append((a, b + delta))
+    else: return None
+  if moved != layout: return None
+  length = layout[-1][1] if layout else 0
+  old_length = old_layout[-1][1] if old_layout else 0
+  # Edits past the last region leave the text as it was
+  if start >= old_length and length == old_length: return (length, length, 0)
+  if end > length: return None
+  return span
+
+def build_request(view, query, pos=None, fragments=True):
+  """Build the request document for a query.
+
+  Returns a `(pfile, doc, sent_count)` tuple, where `sent_count` is the
+  change count of the full buffer text included in the request, if any.
+  Must be called on the UI thread.
+  """
+
+  start = time.time()
   pfile = get_pfile(view)
-  if pfile is None or pfile.project.disabled: return
+  if pfile is None or pfile.project.disabled: return (None, None, None)
 
   if isinstance(query, str): query = {"type": query}
   if (pos is None): pos = view.sel()[0].b
 
-  port, port_is_old = server_port(pfile.project)
-  if port is None: return
-
   doc = {"query": query, "files": []}
 
-  if not pfile.dirty:
-    fname, sending_file = (relative_file(pfile), False)
-  if fragments and view.size() > 8000:
-    region = buffer_fragment(view, pos)
-    doc["files"].append({"type": "part",
-                         "name": relative_file(pfile),
-                         "offset": region.a,
-                         "text": view.substr(region)})
-    pos -= region.a
-    fname, sending_file = ("#0", False)
-  else:
-    doc["files"].append({"type": "full",
-                         "name": relative_file(pfile),
-                         "text": view_js_text(view)})
-    fname, sending_file = ("#0", True)
-  query["file"] = fname
-  query["end"] = pos
-
-  data = None
+  with pfile.project.lock:
+    region = None
+    if pfile.dirty and fragments and view.size() > 8000:
+      # Only send the fragment around the query when it contains all
+      # changes the server does not have yet
+      region = buffer_fragment(view, pos)
+      span = changed_span(pfile, view)
+      if span is None or span[0] < region.a or span[1] > region.b:
+        region = None
+
+    sent_count = None
+    if not pfile.dirty:
+      fname = relative_file(pfile)
+    elif region is not None:
+      doc["files"].append({"type": "part",
+                           "name": relative_file(pfile),
+                           "offset": region.a,
+                           "text": view.substr(region)})
+      pos -= region.a
+      fname = "#0"
+    else:
+      count = view.change_count()
+      doc["files"].append({"type": "full",
+                           "name": relative_file(pfile),
+                           "text": view_js_text(view)})
+      fname, sent_count = ("#0", count)
+    query["file"] = fname
+    query["end"] = pos
+    file_used(pfile)
+    doc["files"].extend(take_deletes(pfile.project))
+  stats.record_build(query["type"], time.time() - start)
+  return (pfile, doc, sent_count)
+
+def send_request(project, doc):
+  """Send a request to the project's server, starting it if needed.
+
+  Interactive queries are dropped while the server is not responding,
+  see `ServerHealth`. Returns a `(data, error)` tuple. Safe to call from
+  any thread.
+  """
+
+  type, health = (request_type(doc), project.health)
+  if not health.allow(type): return (None, None)
+  port, port_is_old = server_port(project)
+  if port is None: return (None, None)
+  touch_server(project)
+
+  start = time.time()
   try:
-    data = make_request(port, doc)
+    data = make_request(project, port, doc)
+    health.succeeded(type, time.time() - start)
+    return (data, None)
   except Req_Error as e:
-    if not silent: report_error(str(e), pfile.project)
-    return None
+    health.succeeded(type)
+    return (None, str(e))
+  except socket.timeout:
+    # A busy server is left to finish, rather than restarted
+    server_timed_out(project, type, health.timeout(type))
+    return (None, None)
   except:
     pass
 
-  if data is None and port_is_old:
+  if port_is_old:
+    # The server may have died, start a new one
     try:
-      port = server_port(pfile.project, port)[0]
-      if port is None: return
-      data = make_request(port, doc)
-      if data is None: return None
+      port = server_port(project, port)[0]
+      if port is None: return (None, None)
+      data = make_request(project, port, doc)
+      health.succeeded(type)
+      return (data, None)
+    except Req_Error as e:
+      health.succeeded(type)
+      return (None, str(e))
     except Exception as e:
-      if not silent: report_error(str(e), pfile.project)
+      server_timed_out(project, type)
+      return (None, str(e))
+  server_timed_out(project, type)
+  return (None, None)
+
+def server_timed_out(project, type, timeout=None):
+  """Record a failed request, telling the user when interactive queries
+  are paused because of it."""
+
+  pause = project.health.failed(type, timeout)
+  if pause is not None:
+    log_error("server for %s is not responding, pausing queries for %ds" % (project.dir, pause))
+
+def run_command(view, query, pos=None, fragments=True, silent=False):
+  """Run the query on the Tern server.
+
+  See default queries at http://ternjs.net/doc/manual.html#protocol.
+  """
+
+  pfile, doc, sent_count = build_request(view, query, pos, fragments)
+  if pfile is None: return None
+  data, error = send_request(pfile.project, doc)
+  return request_done(pfile, view, sent_count, data, error, silent)
+
+def run_command_async(view, query, callback, pos=None, fragments=True, silent=False,
+                      key=None, slot=None):
+  """Run the query on the Tern server in the background.
+
+  `callback` is called on the UI thread with the response data, or None
+  on failure. Queries with the same `key` share one request while it is
+  pending, and a query submitted to a `slot` supersedes the previous one
+  in that slot, whose callback is then never called.
+  """
+
+  pfile = get_pfile(view)
+  if pfile is None: return None
+  executor = pfile.project.executor
+  if key is not None:
+    ticket = executor.attach(key, lambda result: callback(result[0]), slot)
+    if ticket is not None: return ticket
+
+  # Queue the request while holding the lock, so that the server gets
+  # the project's uploads and deletes in the order they were built
+  with pfile.project.lock:
+    pfile, doc, sent_count = build_request(view, query, pos, fragments)
+    if pfile is None: return None
+    def done(result):
+      callback(request_done(pfile, view, sent_count, result[0], result[1], silent))
+    return executor.submit(lambda: send_request(pfile.project, doc), done, key, slot)
+
+def executors_idle():
+  """Whether no project has queries queued or running."""
+
+  return all(project.executor.idle() for project in list(projects.values()))
+
+def project_changed(project):
+  with project.lock:
+    project.generation += 1
+    project.results.clear()
+
+def result_key(pfile, view, query, pos):
+  """Queries of the same kind at the same identifier share a result."""
+
+  word = view.word(pos)
+  return (relative_file(pfile), word.a, word.b, json.dumps(query, sort_keys=True))
 
-  if sending_file: pfile.dirty = False
+def cached_command(view, query, callback, pos=None, **kwargs):
+  """Like `run_command_async`, but answered from the project's result
+  cache when the same query ran at the same identifier since the project
+  last changed. The callback is then called right away."""
+
+  pfile = get_pfile(view)
+  if pfile is None or pfile.project.disabled: return None
+  if isinstance(query, str): query = {"type": query}
+  if pos is None: pos = view.sel()[0].b
+  project = pfile.project
+  key = result_key(pfile, view, query, pos)
+  with project.lock: data = project.results.get(key, None)
+  stats.record_cache("results", data is not None)
+  if data is not None:
+    callback(data)
+    return None
+
+  disk, disk_key = (None, None)
+  if query["type"] in ("type", "documentation"):
+    disk = disk_cache(project)
+    if disk is not None: disk_key = stored_key(pfile, view, query, pos)
+  generation = project.generation
+  def store(data):
+    if data is None: return
+    with project.lock:
+      if project.generation == generation: project.results.put(key, data)
+    if disk is not None: store_result(disk, disk_key, data)
+  def done(data):
+    store(data)
+    callback(data)
+
+  stored = disk.get(disk_key) if disk is not None else None
+  stats.record_cache("disk", stored is not None)
+  if stored is not None:
+    # Answer from the disk cache, and check the answer in the background
+    callback(stored)
+    return run_command_async(view, query, store, pos, **dict(kwargs, silent=True))
+  return run_command_async(view, query, done, pos, **kwargs)
+
+def disk_cache(project):
+  """The project's on-disk result cache, or None when disabled."""
+
+  if not get_setting("tern_disk_cache", False): return None
+  with project.lock:
+    if project.disk_cache is None:
+      if hasattr(sublime, "cache_path"): dir = os.path.join(sublime.cache_path(), "Tern")
+      else: dir = os.path.join(plugin_dir, "cache")
+      name = hashlib.sha1(project.dir.encode("utf-8")).hexdigest() + ".json"
+      project.disk_cache = DiskCache(os.path.join(dir, name))
+    return project.disk_cache
+
+def stored_key(pfile, view, query, pos):
+  """Stored results are valid for the same query at the same offset in
+  the same text, run by the same version of Tern."""
+
+  count = view.change_count()
+  if pfile.content_hash is None or pfile.content_hash[0] != count:
+    digest = hashlib.sha1(view_js_text(view).encode("utf-8")).hexdigest()
+    pfile.content_hash = (count, digest)
+  return "\n".join((relative_file(pfile), pfile.content_hash[1], str(pos),
+                    json.dumps(query, sort_keys=True), str(tern_version)))
+
+disk_save_scheduled = False
+
+def store_result(disk, key, data):
+  global disk_save_scheduled
+  disk.put(key, data)
+  if not disk_save_scheduled:
+    disk_save_scheduled = True
+    set_timeout_async(save_disk_caches, 10000)
+
+def save_disk_caches():
+  global disk_save_scheduled
+  disk_save_scheduled = False
+  for project in list(projects.values()):
+    if project.disk_cache is not None: project.disk_cache.save()
+
+def request_done(pfile, view, sent_count, data, error, silent):
+  if error is not None and not silent: report_error(error, pfile.project)
+  if data is not None and sent_count is not None: mark_synced(pfile, view, sent_count)
   return data
 
+def mark_synced(pfile, view, count):
+  with pfile.project.lock:
+    pfile.synced = count
+    pfile.dirty = view.change_count() != count
+
 def send_buffer(pfile, view):
-  port = server_port(pfile.project)[0]
-  if port is None: return False
-  try:
-    make_request(port,
-                 {"files": [{"type": "full",
+  with flush_lock: dirty_files.pop(pfile, None)
+  send_buffers([(pfile, view)])
+
+def send_buffers(entries):
+  """Upload the full text of `(pfile, view)` pairs, in one request per
+  project."""
+
+  by_project = {}
+  for pfile, view in entries:
+    by_project.setdefault(pfile.project, []).append((pfile, view))
+  for project, group in by_project.items():
+    doc, sent = ({"files": []}, [])
+    with project.lock:
+      for pfile, view in group:
+        count = view.change_count()
+        doc["files"].append({"type": "full",
                              "name": relative_file(pfile),
-                             "text": view_js_text(view)}]})
-    pfile.dirty = False
-    return True
-  except:
-    return False
+                             "text": view_js_text(view)})
+        file_used(pfile)
+        sent.append((pfile, view, count))
+      doc["files"].extend(take_deletes(project))
+      project_changed(project)
+      def done(result, project=project, sent=sent):
+        if result[0] is None: return
+        with project.lock:
+          for pfile, view, count in sent:
+            # Files unloaded again to stay within the limit are not synced
+            if pfile in project.loaded: mark_synced(pfile, view, count)
+      # Index the symbols of saved files along with the upload
+      indexed = [(relative_file(pfile), view_js_text(view)) for pfile, view in group
+                 if os.path.isfile(pfile.name)]
+      def send(project=project, doc=doc, indexed=indexed):
+        for name, text in indexed: project.symbols.update_file(name, text)
+        return send_request(project, doc)
+      project.executor.submit(send, done)
+
+def file_used(pfile):
+  """Mark the file as recently used by the server, unloading the least
+  recently used non-project buffers beyond `tern_max_loaded_files`.
+
+  Files of the project itself are never unloaded, since that would take
+  their definitions out of inference for the other files.
+  """
+
+  limit = get_setting("tern_max_loaded_files", 0)
+  with pfile.project.lock:
+    loaded, name = (pfile.project.loaded, relative_file(pfile))
+    if pfile in loaded: loaded.remove(pfile)
+    loaded.append(pfile)
+    if name in pfile.project.pending_deletes: pfile.project.pending_deletes.remove(name)
+    if not limit: return
+    outside = [f for f in loaded if not f.in_project]
+    while len(outside) > limit:
+      unload_file(outside.pop(0))
+
+def unload_file(pfile):
+  """Delete the file from the server with the next request. It is sent
+  again in full when it is next queried."""
+
+  project = pfile.project
+  with project.lock:
+    if pfile not in project.loaded: return
+    project.loaded.remove(pfile)
+    project.pending_deletes.append(relative_file(pfile))
+    pfile.dirty, pfile.synced = (True, None)
+
+def take_deletes(project):
+  with project.lock:
+    deletes = [{"type": "delete", "name": name} for name in project.pending_deletes]
+    project.pending_deletes = []
+  return deletes
 
 def report_error(message, project):
-  if sublime.ok_cancel_dialog(message, "Disable Tern"):
-    project.disabled = True
+  log_error(message)
+
+def log_error(message):
+  """Show an error in the status bar and the console, without
+  interrupting typing."""
+
+  message = "Tern: " + message.strip()
+  print(message)
+  first_line = message.split("\n", 1)[0]
+  sublime.set_timeout(lambda: sublime.status_message(first_line), 0)
 
 def completion_icon(type):
   if type is None or type == "?": return "\t? "
@@ -437,107 +1456,215 @@ def create_arg_str(arguments):
 
 # parse the type to get the arguments
 def get_arguments(type):
-  type = type[3:type.find(')')] + ",'"
-  arg_list = []
-  arg_start = 0
-  arg_end = 0
-  # this two variables are used to skip ': {...}' in signature like 'a: {...}'
-  depth = 0
-  arg_already = False
-  for ch in type:
-    if depth == 0 and ch == ',':
-      if arg_already:
-        arg_already = False
-      elif arg_start != arg_end:
-        arg_list.append(type[arg_start:arg_end])
-      arg_start = arg_end+1
-    elif depth == 0 and ch == ':':
-      arg_already = True
-      arg_list.append(type[arg_start:arg_end])
-    elif ch == '{' or ch == '(' or ch == '[':
-      depth += 1
-    elif ch == '}' or ch == ')' or ch == ']':
-      depth -= 1
-    elif ch == ' ':
-      arg_start = arg_end + 1
-    arg_end += 1
-  return arg_list
+  return parse_type(type).arg_names
+
+class CompletionList(object):
+  """The completions fetched at `start` for the typed `word`.
+
+  Completions are indexed by name, so narrowing them down to a longer
+  word is a range lookup. Results post-processed for a given context are
+  kept in `variants`. A `truncated` list only holds some of the matches,
+  and can't be narrowed down.
+  """
+
+  def __init__(self, start, word, names, completions, truncated=False):
+    self.start = start
+    self.word = word
+    self.completions = completions
+    self.truncated = truncated
+    self.order = sorted(range(len(names)), key=lambda i: names[i])
+    self.names = [names[i] for i in self.order]
+    self.variants = []
+
+  def narrow(self, word):
+    if word == self.word or not word: return self.completions
+    lo = bisect.bisect_left(self.names, word)
+    hi = bisect.bisect_left(self.names, word[:-1] + unichr(ord(word[-1]) + 1))
+    return [self.completions[i] for i in sorted(self.order[lo:hi])]
+
+  def variant(self, context, process):
+    for c, completions in self.variants:
+      if c == context: return completions
+    completions = process(self.narrow(context[0]))
+    self.variants.insert(0, (context, completions))
+    del self.variants[4:]
+    return completions
+
+# The most completions kept from a response in lean mode
+LEAN_COMPLETION_LIMIT = 200
 
 def ensure_completions_cached(pfile, view):
+  """Return the cached completions for the cursor position.
+
+  Returns a `(completion_list, typed_word)` tuple, or None when nothing is
+  cached, in which case completions are fetched in the background and
+  shown once they arrive.
+  """
+
   pos = view.sel()[0].b
-  if pfile.cached_completions is not None:
-    c_start, c_word, c_completions = pfile.cached_completions
-    if c_start <= pos:
-      slice = view.substr(sublime.Region(c_start, pos))
-      if slice.startswith(c_word) and not re.match(".*\\W", slice):
-        return (c_completions, False)
+  cached = cached_completions(pfile, view, pos)
+  stats.record_cache("completions", cached is not None)
+  if cached is not None: return cached
 
-  data = run_command(view, {"type": "completions", "types": True, "includeKeywords": True})
-  if data is None: return (None, False)
+  pending = pfile.pending_completions
+  if pending is not None and pending <= pos and \
+     not re.match(".*\\W", view.substr(sublime.Region(pending, pos))):
+    return None
+
+  line_start = view.line(pos).a
+  before = view.substr(sublime.Region(line_start, pos))
+  lean = get_setting("tern_lean_completions", False)
+  def add(data):
+    start = data["start"]
+    if start < line_start: word = view.substr(sublime.Region(start, pos))
+    else: word = before[start - line_start:]
+    records = data["completions"]
+    truncated = lean and len(records) > LEAN_COMPLETION_LIMIT
+    if truncated: records = records[:LEAN_COMPLETION_LIMIT]
+    # Without types, the server sends plain names
+    data["completions"] = [rec if isinstance(rec, dict) else {"name": rec} for rec in records]
+    names = [rec.get("name") for rec in data["completions"]]
+    clist = CompletionList(start, word, names, build_completions(data), truncated)
+    # Replaced rather than changed in place, so readers can go on using
+    # the old list
+    with pfile.project.lock:
+      pfile.cached_completions = [clist] + pfile.cached_completions[:7]
+
+  query = {"type": "completions", "types": True, "includeKeywords": True}
+  if lean:
+    # Types are only needed for argument completion, and keywords can't
+    # follow a dot
+    query["types"] = arg_completion_enabled
+    query["includeKeywords"] = not re.search("\\.\\s*[\\w$]*$", before)
+
+  disk = disk_cache(pfile.project)
+  stored = None
+  if disk is not None:
+    key = stored_key(pfile, view, query, pos)
+    stored = disk.get(key)
+    stats.record_cache("disk", stored is not None)
+  def done(data):
+    pfile.pending_completions = None
+    if data is None: return
+    add(data)
+    if disk is not None: store_result(disk, key, data)
+    # Fresh results for stored ones replace them quietly
+    if stored is None and cached_completions(pfile, view, view.sel()[0].b) is not None:
+      show_completions(view)
+
+  pfile.pending_completions, ticket = (pos, None)
+  try:
+    ticket = run_command_async(view, query, done, slot="completions:%d" % view.id())
+  finally:
+    if ticket is None: pfile.pending_completions = None
+  if stored is not None:
+    add(stored)
+    return cached_completions(pfile, view, pos)
+  return None
+
+def cached_completions(pfile, view, pos):
+  """Find a cached completion list whose word the text before `pos` extends.
+
+  Prefers the list fetched for the longest word, which is the smallest.
+  """
 
+  found = None
+  for clist in pfile.cached_completions:
+    if clist.start > pos: continue
+    typed = view.substr(sublime.Region(clist.start, pos))
+    if clist.truncated and typed != clist.word: continue
+    if typed.startswith(clist.word) and not re.match(".*\\W", typed):
+      if found is None or len(clist.word) > len(found[0].word): found = (clist, typed)
+  return found
+
+def show_completions(view):
+  view.run_command("hide_auto_complete")
+  view.run_command("auto_complete", {"disable_auto_insert": True,
+                                     "next_completion_if_showing": False})
+
+# The display suffix and argument snippet of a function completion,
+# memoized on the signature.
+def fn_completion_parts(sig):
+  parts = sig.memo.get("completion", None)
+  if parts is None:
+    retval = sig.retval
+    if retval is None or retval == "()":
+      retval = ""
+    elif retval.startswith("{"):
+      retval = "{}"
+    elif retval.startswith("["):
+      retval = "[]"
+
+    if retval != "":
+      retval = " -> " + retval
+
+    parts = sig.memo["completion"] = (fn_completion_icon(sig.arg_names, retval),
+                                      create_arg_str(sig.arg_names))
+  return parts
+
+def build_completions(data):
   completions = []
   completions_arity = []
   for rec in data["completions"]:
     rec_name = rec.get('name').replace('$', '\\$')
     rec_type = rec.get("type", None)
     if arg_completion_enabled and rec_type is not None and rec_type.startswith("fn("):
-      retval = parse_function_type(rec).get('retval')
-
-      if retval is None or retval == "()":
-        retval = ""
-      elif retval.startswith("{"):
-        retval = "{}"
-      elif retval.startswith("["):
-        retval = "[]"
-
-      if retval != "":
-        retval = " -> " + retval
-
-      arguments = get_arguments(rec_type)
-      fn_name = rec_name + "(" + create_arg_str(arguments) + ")"
-      completions.append((rec.get("name") + fn_completion_icon(arguments, retval), fn_name))
+      icon, arg_str = fn_completion_parts(parse_type(rec_type))
+      completions.append((rec.get("name") + icon, rec_name + "(" + arg_str + ")"))
+    elif "type" not in rec:
+      completions.append((rec.get("name"), rec_name))
     else:
       completions.append((rec.get("name") + completion_icon(rec_type), rec_name))
 
   # put the auto completions of functions with lower arity at the bottom of the autocomplete list
   # so they don't clog up the autocompeltions at the top of the list
-  completions = completions + completions_arity
-  pfile.cached_completions = (data["start"], view.substr(sublime.Region(data["start"], pos)), completions)
-  return (completions, True)
+  return completions + completions_arity
+
+call_indexes = {}
+
+def call_index(view):
+  """The bracket index of the buffer's JS text, updated for the edits
+  since it was last used."""
+
+  with buffer_lock:
+    index = call_indexes.get(view.buffer_id(), None)
+    if index is None: index = call_indexes[view.buffer_id()] = BracketIndex()
+    count = view.change_count()
+    if index.count != count:
+      text, layout = (view_js_text(view), js_layout(view))
+      span = None
+      if index.count is not None: span = js_edit_span(view, index.count, count, index.regions, layout)
+      index.update(count, text, span)
+      index.regions = layout
+      if view.change_count() != count: index.count = None
+    return index
 
 def locate_call(view):
   sel = view.sel()[0]
   if sel.a != sel.b: return (None, 0)
-  context = view.substr(sublime.Region(max(0, sel.b - 500), sel.b))
-  pos = len(context)
-  depth = argpos = 0
-  while pos > 0:
-    pos -= 1
-    ch = context[pos]
-    if ch == "}" or ch == ")" or ch == "]":
-      depth += 1
-    elif ch == "{" or ch == "(" or ch == "[":
-      if depth > 0: depth -= 1
-      elif ch == "(": return (pos + sel.b - len(context), argpos)
-      else: return (None, 0)
-    elif ch == "," and depth == 0:
-      argpos += 1
-  return (None, 0)
+  with buffer_lock: return call_index(view).enclosing_call(sel.b, 500)
 
 def show_argument_hints(pfile, view):
   call_start, argpos = locate_call(view)
   if call_start is None: return render_argument_hints(pfile, view, None, 0)
-  if pfile.cached_arguments is not None and pfile.cached_arguments[0] == call_start:
-    return render_argument_hints(pfile, view, pfile.cached_arguments[1], argpos)
+  hit = pfile.cached_arguments is not None and pfile.cached_arguments[0] == call_start
+  stats.record_cache("arguments", hit)
+  if hit: return render_argument_hints(pfile, view, pfile.cached_arguments[1], argpos)
 
-  data = run_command(view, {"type": "type", "preferFunction": True}, call_start, silent=True)
-  if data is not None:
+  def done(data):
+    if data is None: return
     parsed = parse_function_type(data)
     if parsed is not None:
       parsed['url'] = data.get('url', None)
       parsed['doc'] = data.get('doc', None)
       pfile.cached_arguments = (call_start, parsed)
-      render_argument_hints(pfile, view, parsed, argpos)
+      cur_start, cur_argpos = locate_call(view)
+      if cur_start == call_start:
+        render_argument_hints(pfile, view, parsed, cur_argpos)
+
+  cached_command(view, {"type": "type", "preferFunction": True}, done, call_start, silent=True,
+                 key=("type", view.id(), view.change_count(), call_start),
+                 slot="arghints:%d" % view.id())
 
 def render_argument_hints(pfile, view, ftype, argpos):
   if ftype is None:
@@ -546,38 +1673,13 @@ def render_argument_hints(pfile, view, ftype, argpos):
     renderer.render_arghints(pfile, view, ftype, argpos)
 
 def parse_function_type(data):
-  type = data["type"]
-  if not re.match("fn\\(", type): return None
-  pos = 3
-  args, retval = ([], None)
-  while pos < len(type) and type[pos] != ")":
-    colon = type.find(":", pos)
-    name = "?"
-    if colon != -1:
-      name = type[pos:colon]
-      if not re.match("[\\w_$]+$", name): name = "?"
-      else: pos = colon + 2
-    type_start = pos
-    depth = 0
-    while pos < len(type):
-      ch = type[pos]
-      if ch == "(" or ch == "[" or ch == "{":
-        depth += 1
-      elif ch == ")" or ch == "]" or ch == "}":
-        if depth > 0: depth -= 1
-        else: break
-      elif ch == "," and depth == 0:
-        break
-      pos += 1
-    args.append((name, type[type_start:pos]))
-    if type[pos] == ",": pos += 2
-  if type[pos:pos + 5] == ") -> ":
-    retval = type[pos + 5:]
+  sig = parse_type(data["type"])
+  if not sig.is_fn: return None
   return {"name": data.get("exprName", None) or data.get("name", None) or "fn",
-          "args": args,
-          "retval": retval}
+          "args": sig.args,
+          "retval": sig.retval}
 
-jump_stack = []
+jump_stack = collections.deque(maxlen=50)
 
 class TernArghintCommand(sublime_plugin.TextCommand):
   def run(self, edit, **args):
@@ -585,98 +1687,275 @@ class TernArghintCommand(sublime_plugin.TextCommand):
 
 class TernJumpToDef(sublime_plugin.TextCommand):
   def run(self, edit, **args):
-    data = run_command(self.view, {"type": "definition", "lineCharPositions": True})
-    if data is None: return
-    file = data.get("file", None)
-    if file is not None:
-      # Found an actual definition
-      row, col = self.view.rowcol(self.view.sel()[0].b)
-      cur_pos = self.view.file_name() + ":" + str(row + 1) + ":" + str(col + 1)
+    view = self.view
+    row, col = view.rowcol(view.sel()[0].b)
+    cur_pos = (view.file_name() or "") + ":" + str(row + 1) + ":" + str(col + 1)
+    cached_command(view, {"type": "definition", "lineCharPositions": True},
+                   lambda data: jump_to_def(view, data, cur_pos))
+
+def jump_to_def(view, data, cur_pos):
+  if data is None: return
+  file = data.get("file", None)
+  if file is not None:
+    # Found an actual definition
+    if view.file_name() is not None:
       jump_stack.append(cur_pos)
-      if len(jump_stack) > 50: jump_stack.pop(0)
-      real_file = (os.path.join(get_pfile(self.view).project.dir, file) +
-        ":" + str(data["start"]["line"] + 1) + ":" + str(data["start"]["ch"] + 1))
-      sublime.active_window().open_file(real_file, sublime.ENCODED_POSITION)
+    real_file = (os.path.join(get_pfile(view).project.dir, file) +
+      ":" + str(data["start"]["line"] + 1) + ":" + str(data["start"]["ch"] + 1))
+    sublime.active_window().open_file(real_file, sublime.ENCODED_POSITION)
+  else:
+    url = data.get("url", None)
+    if url is None:
+      sublime.error_message("Could not find a definition")
     else:
-      url = data.get("url", None)
-      if url is None:
-        sublime.error_message("Could not find a definition")
-      else:
-        webbrowser.open(url)
+      webbrowser.open(url)
 
 class TernJumpBack(sublime_plugin.TextCommand):
   def run(self, edit, **args):
-    if len(jump_stack) > 0:
+    try:
       sublime.active_window().open_file(jump_stack.pop(), sublime.ENCODED_POSITION)
+    except IndexError:
+      pass
 
 class TernSelectVariable(sublime_plugin.TextCommand):
   def run(self, edit, **args):
-    data = run_command(self.view, "refs", fragments=False)
-    if data is None: return
-    file = relative_file(get_pfile(self.view))
-    shown_error = False
-    regions = []
-    for ref in data["refs"]:
-      if ref["file"].replace('\\','/') != file.replace('\\','/'):
-        if not shown_error:
-          sublime.error_message("Not all uses of this variable are file-local. Selecting only local ones.")
-          shown_error = True
-      else:
-        regions.append(sublime.Region(ref["start"], ref["end"]))
-    self.view.sel().clear()
-    for r in regions: self.view.sel().add(r)
+    view = self.view
+    count = view.change_count()
+    run_command_async(view, "refs", lambda data: select_refs(view, data, count), fragments=False)
+
+def select_refs(view, data, count):
+  # The offsets are stale once the buffer was edited meanwhile
+  if data is None or view.change_count() != count: return
+  file = relative_file(get_pfile(view))
+  shown_error = False
+  regions = []
+  for ref in data["refs"]:
+    if ref["file"].replace('\\','/') != file.replace('\\','/'):
+      if not shown_error:
+        sublime.error_message("Not all uses of this variable are file-local. Selecting only local ones.")
+        shown_error = True
+    else:
+      regions.append(sublime.Region(ref["start"], ref["end"]))
+  view.sel().clear()
+  for r in regions: view.sel().add(r)
 
 
 class TernDescribe(sublime_plugin.TextCommand):
   def run(self, edit, **args):
-    data = run_command(self.view, {"type": "documentation"})
-    if data is None:
-      return
-    renderer.render_description(get_pfile(self.view), self.view,
-                                data["type"], data.get("doc", None),
-                                data.get("url", None))
+    view = self.view
+    cached_command(view, {"type": "documentation"}, lambda data: describe(view, data))
+
+def describe(view, data):
+  if data is None:
+    return
+  renderer.render_description(get_pfile(view), view,
+                              data["type"], data.get("doc", None),
+                              data.get("url", None))
+
+# Hovering shows type information after the mouse rests this many
+# milliseconds, or right away when it is cached
+HOVER_DELAY = 300
+# View id -> the time of the hover being waited for
+pending_hovers = {}
+
+def show_hover(view, point):
+  if view.score_selector(point, "source.js") <= 0 or view.score_selector(point, "comment") > 0: return
+  pfile = get_pfile(view)
+  if pfile is None: return
+  query = {"type": "documentation"}
+  with pfile.project.lock:
+    data = pfile.project.results.get(result_key(pfile, view, query, point), None)
+  if data is not None: return render_hover(view, point, data)
+
+  stamp = pending_hovers[view.id()] = time.time()
+  def done(data):
+    if pending_hovers.get(view.id(), None) == stamp: render_hover(view, point, data)
+  def settled():
+    if pending_hovers.get(view.id(), None) == stamp:
+      cached_command(view, query, done, point, silent=True, slot="hover:%d" % view.id())
+  sublime.set_timeout(settled, HOVER_DELAY)
+
+def render_hover(view, point, data):
+  if data is None or not data.get("type", None): return
+  message = get_description_message(True, data["type"], data.get("doc", None), data.get("url", None))
+  view.show_popup(message, sublime.HIDE_ON_MOUSE_MOVE_AWAY, point,
+                  max_width=600, on_navigate=go_to_url)
+
+def refresh_symbols(project, callback=None):
+  """Index the files the server has loaded that are not indexed yet, in
+  the background, then call `callback` on the UI thread."""
+
+  symbols = project.symbols
+  def run():
+    try:
+      data = send_request(project, {"query": {"type": "files"}})[0]
+      for name in (data or {}).get("files", []):
+        if symbols.has_file(name): continue
+        path = os.path.join(project.dir, name)
+        try:
+          with open(path, "rb") as f: text = f.read().decode("utf-8", "replace")
+        except (IOError, OSError):
+          continue
+        symbols.update_file(name, text)
+    finally:
+      symbols.building = False
+      symbols.built = True
+      if callback is not None: sublime.set_timeout(callback, 0)
+  if symbols.building: return
+  symbols.building = True
+  thread = threading.Thread(target=run)
+  thread.daemon = True
+  thread.start()
+
+class TernGotoSymbol(sublime_plugin.TextCommand):
+  def run(self, edit, **args):
+    view = self.view
+    pfile = get_pfile(view)
+    if pfile is None: return
+    project = pfile.project
+    for window in sublime.windows():
+      for other in window.views():
+        opfile = files.get(pfile_name(other), None)
+        if opfile is not None and opfile.project is project and other.file_name() is not None and \
+           not project.symbols.has_file(relative_file(opfile)):
+          project.symbols.update_file(relative_file(opfile), view_js_text(other))
+
+    query = args.get("query", "")
+    if project.symbols.built:
+      refresh_symbols(project)
+      show_symbols(view, project, query)
+    else:
+      sublime.status_message("Tern: indexing project symbols")
+      refresh_symbols(project, lambda: show_symbols(view, project, query))
+
+def show_symbols(view, project, query):
+  entries = project.symbols.search(query, 5000)
+  if not entries: return sublime.status_message("Tern: no symbols found")
+  items = [[name, "%s:%d  %s" % (file, line + 1, kind)] for _, name, kind, file, line, col in entries]
+  row, col = view.rowcol(view.sel()[0].b)
+  cur_pos = (view.file_name() or "") + ":" + str(row + 1) + ":" + str(col + 1)
+  def select(i):
+    if i < 0: return
+    _, name, kind, file, line, col = entries[i]
+    if view.file_name() is not None:
+      jump_stack.append(cur_pos)
+    sublime.active_window().open_file(os.path.join(project.dir, file) + ":%d:%d" % (line + 1, col + 1),
+                                      sublime.ENCODED_POSITION)
+  view.window().show_quick_panel(items, select)
+
+class TernListServers(sublime_plugin.TextCommand):
+  def run(self, edit, **args):
+    now = time.time()
+    lines = []
+    for info in server_info():
+      rss = "?" if info["rss"] is None else "%.1f MB" % (info["rss"] / 1024.0)
+      lines.append("%s\n  pid %d, port %s, rss %s, last used %ds ago\n  %s" %
+                   (info["dir"], info["pid"], info["port"], rss, now - info["last_used"],
+                    info["health"]))
+    window = self.view.window()
+    panel = window.get_output_panel("tern_servers")
+    panel.run_command("tern_arghint", {"msg": "\n".join(lines) or "No Tern servers running"})
+    window.run_command("show_panel", {"panel": "output.tern_servers"})
+
+class TernShowStats(sublime_plugin.TextCommand):
+  def run(self, edit, **args):
+    if args.get("reset", False): stats.reset()
+    message = stats.report()
+    if not stats.enabled: message = "Statistics are disabled, set tern_stats to enable them.\n\n" + message
+    window = self.view.window()
+    panel = window.get_output_panel("tern_stats")
+    panel.run_command("tern_arghint", {"msg": message})
+    window.run_command("show_panel", {"panel": "output.tern_stats"})
 
 class TernDisableProject(sublime_plugin.TextCommand):
   def run(self, edit, **args):
     pfile = get_pfile(self.view)
-    pfile.project.disabled = False
+    if pfile is not None: pfile.project.disabled = True
 
 class TernEnableProject(sublime_plugin.TextCommand):
   def run(self, edit, **args):
-    pfile = get_pfile(self.view)
-    pfile.project.disabled = True
+    # get_pfile skips the files of disabled projects
+    pfile = files.get(pfile_name(self.view), None)
+    if pfile is not None: pfile.project.disabled = False
+
+# Setting values read so far, cleared whenever either settings file changes
+settings_snapshot = {}
 
 # fetch a certain setting from the package settings file and if it doesn't exist check the
 # Preferences.sublime-settings file for backwards compatibility.
 def get_setting(key, default):
-  old_settings = sublime.load_settings("Preferences.sublime-settings")
-  new_settings = sublime.load_settings("Tern.sublime-settings")
+  if key not in settings_snapshot:
+    old_settings = sublime.load_settings("Preferences.sublime-settings")
+    new_settings = sublime.load_settings("Tern.sublime-settings")
 
-  setting = new_settings.get(key, None)
-  if setting is None:
-    return old_settings.get(key, default)
-  else:
-    return new_settings.get(key, default)
+    setting = new_settings.get(key, None)
+    if setting is None:
+      setting = old_settings.get(key, None)
+    settings_snapshot[key] = setting
+
+  setting = settings_snapshot[key]
+  return default if setting is None else setting
+
+def settings_changed():
+  settings_snapshot.clear()
+  apply_settings()
 
 plugin_dir = os.path.abspath(os.path.dirname(__file__))
 
-def plugin_loaded():
+def apply_settings():
   global arghints_enabled, renderer, tern_command, tern_arguments
-  global arg_completion_enabled
+  global arg_completion_enabled, output_style, hover_enabled, tern_version
   arghints_enabled = get_setting("tern_argument_hints", False)
+  hover_enabled = get_setting("tern_hover_info", False) and "show_popup" in dir(sublime.View)
   arg_completion_enabled = get_setting("tern_argument_completion", False)
 
   if "show_popup" in dir(sublime.View):
     default_output_style = "tooltip"
   else:
     default_output_style = "status"
-  output_style = get_setting("tern_output_style", get_setting("tern_argument_hints_type", default_output_style))
-  renderer = create_renderer(output_style)
-  tern_arguments = get_setting("tern_arguments", [])
-  if not isinstance(tern_arguments, list):
-    tern_arguments = [tern_arguments]
-  tern_command = get_setting("tern_command", None)
-  if tern_command is None:
+  style = get_setting("tern_output_style", get_setting("tern_argument_hints_type", default_output_style))
+  if renderer is None or style != output_style:
+    output_style = style
+    renderer = create_renderer(output_style)
+
+  command, arguments = (get_setting("tern_command", None), get_setting("tern_arguments", []))
+  if not isinstance(arguments, list):
+    arguments = [arguments]
+  if command is None and not install_failed:
+    command = ["node",  os.path.join(plugin_dir, "node_modules/tern/bin/tern"), "--no-port-file"]
+  if command is not None and not isinstance(command, list):
+    command = [command]
+  if tern_command is not None and (command != tern_command or arguments != tern_arguments):
+    # Restart servers with the new command on their next query
+    for project in list(servers): kill_server(project)
+  tern_command, tern_arguments = (command, arguments)
+
+  tern_version = get_tern_version(command)
+
+  stats.enabled = get_setting("tern_stats", False)
+  stats.export_path = get_setting("tern_stats_file", None)
+
+def get_tern_version(command):
+  """The version of the bundled Tern, or the command that runs another."""
+
+  try:
+    with open(os.path.join(plugin_dir, "node_modules", "tern", "package.json"), "r") as f:
+      version = json.load(f).get("version", None)
+  except (IOError, OSError, ValueError):
+    version = None
+  if command is not None and os.path.join(plugin_dir, "node_modules/tern/bin/tern") in command:
+    return version
+  return " ".join(command or [])
+
+install_failed = False
+
+def plugin_loaded():
+  global install_failed
+  set_timeout_async(check_servers, 5000)
+  for name in ("Preferences.sublime-settings", "Tern.sublime-settings"):
+    sublime.load_settings(name).add_on_change("tern_for_sublime", settings_changed)
+
+  if get_setting("tern_command", None) is None:
     if not os.path.isdir(os.path.join(plugin_dir, "node_modules/tern")):
       if sublime.ok_cancel_dialog(
           "It appears Tern has not been installed. Do you want tern_for_sublime to try and install it? "
@@ -695,12 +1974,17 @@ def plugin_loaded():
           if hasattr(e, "returncode"):
             msg += "\nReturn code was: " + str(e.returncode)
           sublime.error_message(msg)
-          return
-    tern_command = ["node",  os.path.join(plugin_dir, "node_modules/tern/bin/tern"), "--no-port-file"]
+          install_failed = True
+  apply_settings()
+
+def plugin_unloaded():
+  for name in ("Preferences.sublime-settings", "Tern.sublime-settings"):
+    sublime.load_settings(name).clear_on_change("tern_for_sublime")
 
 def cleanup():
-  for f in files.values():
-    kill_server(f.project)
+  save_disk_caches()
+  for project in list(servers):
+    kill_server(project)
 
 atexit.register(cleanup)
 
@@ -0,0 +1,158 @@
+# encoding=utf8
+
+import bisect
+import re
+
+# Brackets, commas, and the starts of comments, strings and regexps
+TOKEN = re.compile(r"[()\[\]{},]|//|/\*|[\"'`/]")
+BRACKETS = "()[]{},"
+STRING_REST = {
+  "\"": re.compile(r"(?:[^\"\\\n]|\\[\s\S])*\"?"),
+  "'": re.compile(r"(?:[^'\\\n]|\\[\s\S])*'?"),
+  "`": re.compile(r"(?:[^`\\]|\\[\s\S])*`?"),
+}
+REGEXP_REST = re.compile(r"(?:[^/\\\[\n]|\\.|\[(?:[^\]\\\n]|\\.)*\]?)*/?")
+# A slash at the start of a line or after one of these characters or
+# keywords starts a regexp
+REGEXP_AFTER = "\n(,=:[!&|?{};+-*%<>~^"
+KEYWORD_BEFORE = re.compile(r"(?:^|[^\w$])(?:return|typeof|case|do|else|in|of|new|delete|void|throw|yield|await)$")
+
+
+def starts_regexp(text, pos):
+  i = pos - 1
+  while i >= 0 and text[i] in " \t\r": i -= 1
+  if i < 0 or text[i] in REGEXP_AFTER: return True
+  return KEYWORD_BEFORE.search(text, max(0, i - 10), i + 1) is not None
+
+def next_line(text, pos):
+  end = text.find("\n", pos)
+  return len(text) if end == -1 else end + 1
+
+
+class BracketIndex(object):
+  """The brackets and commas of a JavaScript text, outside of strings,
+  comments and regexps.
+
+  `offsets` and `chars` hold the position and character of every token.
+  `span_starts` and `span_ends` delimit the strings and comments that
+  continue over a line break, so that an edit can be rescanned from a
+  line start that is not inside one. `count` is the change count of the
+  indexed text, and `regions` is left to the caller to record where that
+  text came from.
+  """
+
+  def __init__(self):
+    self.count = None
+    self.regions = None
+    self.offsets, self.chars = ([], [])
+    self.span_starts, self.span_ends = ([], [])
+
+  def scan(self, text, pos, end):
+    """Tokenize `text` from `pos`, which must not be inside a string or
+    comment, up to `end` or, when a string or comment runs past `end`,
+    to the start of the line after it.
+
+    Returns `(offsets, chars, span_starts, span_ends, stop)`.
+    """
+
+    offsets, chars, span_starts, span_ends = ([], [], [], [])
+    while True:
+      m = TOKEN.search(text, pos, end)
+      if m is None: break
+      tok, start = (m.group(), m.start())
+      if tok in BRACKETS:
+        offsets.append(start)
+        chars.append(tok)
+        pos = start + 1
+        continue
+      if tok == "//":
+        pos = text.find("\n", start)
+        if pos == -1: pos = len(text)
+        continue
+      if tok == "/*":
+        pos = text.find("*/", start + 2)
+        pos = len(text) if pos == -1 else pos + 2
+      elif tok == "/":
+        if not starts_regexp(text, start):
+          pos = start + 1
+          continue
+        pos = REGEXP_REST.match(text, start + 1).end()
+      else:
+        pos = STRING_REST[tok].match(text, start + 1).end()
+      if text.find("\n", start, pos) != -1:
+        span_starts.append(start)
+        span_ends.append(pos)
+        if pos > end: end = next_line(text, pos)
+    return (offsets, chars, span_starts, span_ends, end)
+
+  def span_at(self, pos):
+    """The index of the multi-line string or comment containing `pos`, or -1."""
+
+    i = bisect.bisect_left(self.span_starts, pos) - 1
+    if i >= 0 and self.span_ends[i] > pos: return i
+    return -1
+
+  def update(self, count, text, span):
+    """Index `text`, given the `(start, end, delta)` span edited since
+    the indexed version, or None to index it from scratch."""
+
+    if span is None:
+      self.offsets, self.chars, self.span_starts, self.span_ends, _ = self.scan(text, 0, len(text))
+      self.count = count
+      return
+
+    edit_start, edit_end, delta = span
+    start = text.rfind("\n", 0, edit_start) + 1
+    i = self.span_at(start)
+    # A comment or template left open runs up to the end of the text, and
+    # takes in whatever is added there
+    if i == -1 and self.span_ends and self.span_ends[-1] == len(text) - delta and \
+       self.span_starts[-1] <= start: i = len(self.span_starts) - 1
+    if i != -1: start = self.span_starts[i]
+    # Rescan until a line start past the edit that the previous scan did
+    # not see inside a string or comment either; from there on the tokens
+    # are the old ones, shifted by `delta`.
+    new, pos, end = (([], [], [], []), start, next_line(text, edit_end))
+    while True:
+      scanned = self.scan(text, pos, end)
+      for i in range(4): new[i].extend(scanned[i])
+      pos = scanned[4]
+      i = self.span_at(pos - delta)
+      if i == -1 or pos >= len(text): break
+      end = next_line(text, self.span_ends[i] + delta)
+
+    before = bisect.bisect_left(self.offsets, start)
+    after = bisect.bisect_left(self.offsets, pos - delta)
+    self.offsets = self.offsets[:before] + new[0] + [x + delta for x in self.offsets[after:]]
+    self.chars = self.chars[:before] + new[1] + self.chars[after:]
+    before = bisect.bisect_left(self.span_starts, start)
+    after = bisect.bisect_left(self.span_starts, pos - delta)
+    self.span_starts = self.span_starts[:before] + new[2] + [x + delta for x in self.span_starts[after:]]
+    self.span_ends = self.span_ends[:before] + new[3] + [x + delta for x in self.span_ends[after:]]
+    self.count = count
+
+  def enclosing_call(self, pos, limit):
+    """Find the innermost unclosed `(` before `pos`, looking back at most
+    `limit` characters, and the number of commas between it and `pos`.
+
+    Returns an `(offset, argument_index)` tuple, or `(None, 0)` when `pos`
+    is not inside parentheses or is directly inside a `[` or `{`.
+    """
+
+    offsets, chars = (self.offsets, self.chars)
+    i = bisect.bisect_left(offsets, pos) - 1
+    depth = argpos = 0
+    while i >= 0 and offsets[i] >= pos - limit:
+      ch = chars[i]
+      if ch == ")" or ch == "]" or ch == "}":
+        depth += 1
+      elif ch == ",":
+        if depth == 0: argpos += 1
+      elif depth > 0:
+        depth -= 1
+      elif ch == "(":
+        return (offsets[i], argpos)
+      else:
+        return (None, 0)
+      i -= 1
+    return (None, 0)
@@ -0,0 +1,54 @@
+# encoding=utf8
+
+
+class ChangeLog(object):
+  """Records the ranges edited in a buffer, tagged with change counts.
+
+  Every entry is a `(change_count, start, end, delta)` tuple, where
+  `start`/`end` delimit the new text in the buffer as it was right after
+  the edit and `delta` is the change in buffer size. Only the most recent
+  `limit` entries are kept, after which older change counts are reported
+  as unknown. `count` is the latest change count recorded.
+  """
+
+  def __init__(self, count, size, limit=100):
+    self.entries = []
+    self.base = self.count = count
+    self.size = size
+    self.limit = limit
+
+  def record(self, count, start, end, delta):
+    self.entries.append((count, start, end, delta))
+    self.count = max(self.count, count)
+    self.size += delta
+    if len(self.entries) > self.limit:
+      self.base = self.entries.pop(0)[0]
+
+  def reset(self, count, size):
+    """Forget all entries, marking everything up to `count` as unknown."""
+
+    self.entries = []
+    self.base = self.count = count
+    self.size = size
+
+  def span_since(self, count, until=None):
+    """Return the `(start, end, delta)` span edited after `count`.
+
+    The span is expressed in current buffer coordinates. Returns None
+    when the edits since `count` are unknown, or when there are none.
+    Pass the buffer's change count as `until` to get None as well when
+    the last edits have not been recorded yet.
+    """
+
+    if count < self.base: return None
+    if until is not None and until > self.count: return None
+    span = None
+    for c, start, end, delta in self.entries:
+      if c <= count: continue
+      if span is None:
+        span = (start, end, delta)
+      else:
+        s_start, s_end, s_delta = span
+        if s_end >= start: s_end += delta
+        span = (min(s_start, start), max(s_end, end), s_delta + delta)
+    return span
@@ -0,0 +1,61 @@
+# encoding=utf8
+
+import json
+import os
+import threading
+
+from .lru import LRUCache
+
+
+class DiskCache(object):
+  """Query results kept in a JSON file, so that they survive restarts.
+
+  Entries are loaded on first use and written back by `save`. Beyond
+  `size` entries, the least recently used ones are dropped. Keys are
+  strings; values anything JSON can hold. Safe to use from several
+  threads.
+  """
+
+  def __init__(self, path, size=500):
+    self.path = path
+    self.size = size
+    self.lock = threading.Lock()
+    self.entries = None
+    self.changed = False
+
+  def load(self):
+    self.entries = LRUCache(self.size)
+    try:
+      with open(self.path, "r") as f: stored = json.load(f)
+    except (IOError, OSError, ValueError):
+      return
+    # Stored least recently used first
+    for key, value in stored.get("entries", []):
+      self.entries.put(key, value)
+
+  def get(self, key):
+    with self.lock:
+      if self.entries is None: self.load()
+      return self.entries.get(key, None)
+
+  def put(self, key, value):
+    with self.lock:
+      if self.entries is None: self.load()
+      self.entries.put(key, value)
+      self.changed = True
+
+  def save(self):
+    with self.lock:
+      if not self.changed: return
+      self.changed = False
+      by_age = sorted(list(self.entries.entries.items()), key=lambda item: item[1][1])
+    data = json.dumps({"entries": [[key, entry[0]] for key, entry in by_age]})
+    tmp = self.path + ".tmp"
+    try:
+      dir = os.path.dirname(self.path)
+      if not os.path.isdir(dir): os.makedirs(dir)
+      with open(tmp, "w") as f: f.write(data)
+      if os.path.exists(self.path) and not hasattr(os, "replace"): os.remove(self.path)
+      getattr(os, "replace", os.rename)(tmp, self.path)
+    except (IOError, OSError):
+      pass
@@ -0,0 +1,123 @@
+# encoding=utf8
+
+import threading
+import traceback
+
+try:
+  import queue
+except ImportError:
+  # python 2
+  import Queue as queue
+
+
+class Ticket(object):
+  """A single caller's interest in the result of a job."""
+
+  def __init__(self, callback, slot):
+    self.callback = callback
+    self.slot = slot
+    self.cancelled = False
+
+  def cancel(self):
+    self.cancelled = True
+
+
+class Job(object):
+  def __init__(self, key, fn):
+    self.key = key
+    self.fn = fn
+    self.tickets = []
+
+
+class QueryExecutor(object):
+  """Runs jobs on a background thread, in submission order.
+
+  Results are passed to callbacks through `dispatch`, which is expected to
+  run them on the UI thread. Jobs submitted with the same `key` while one
+  is pending share its result. Submitting to a `slot` cancels the previous
+  ticket in that slot, so superseded results are never delivered, and jobs
+  nobody is waiting for anymore are skipped. When a job raises, its
+  callbacks get `failed(exception)`, or None without a `failed` function.
+  """
+
+  def __init__(self, dispatch, failed=None):
+    self.dispatch = dispatch
+    self.failed = failed
+    self.lock = threading.Lock()
+    self.queue = queue.Queue()
+    self.pending = {}
+    self.slots = {}
+    self.thread = None
+
+  def take_slot(self, slot, ticket):
+    if slot is None: return
+    old = self.slots.get(slot, None)
+    if old is not None: old.cancel()
+    self.slots[slot] = ticket
+
+  def attach(self, key, callback=None, slot=None):
+    """Wait for the pending job with `key`, if any. Returns a ticket or None."""
+
+    with self.lock:
+      job = self.pending.get(key, None)
+      if job is None: return None
+      ticket = Ticket(callback, slot)
+      self.take_slot(slot, ticket)
+      job.tickets.append(ticket)
+      return ticket
+
+  def submit(self, fn, callback=None, key=None, slot=None):
+    ticket = Ticket(callback, slot)
+    with self.lock:
+      self.take_slot(slot, ticket)
+      job = self.pending.get(key, None) if key is not None else None
+      if job is not None:
+        job.tickets.append(ticket)
+        return ticket
+      job = Job(key, fn)
+      job.tickets.append(ticket)
+      if key is not None: self.pending[key] = job
+      if self.thread is None:
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+    self.queue.put(job)
+    return ticket
+
+  def idle(self):
+    """Whether no jobs are queued or running."""
+
+    return self.queue.unfinished_tasks == 0
+
+  def run(self):
+    while True:
+      job = self.queue.get()
+      try:
+        self.run_job(job)
+      finally:
+        self.queue.task_done()
+
+  def run_job(self, job):
+    with self.lock:
+      if all(t.cancelled for t in job.tickets):
+        if job.key is not None: self.pending.pop(job.key, None)
+        return
+    try:
+      result = job.fn()
+    except Exception as e:
+      traceback.print_exc()
+      result = self.failed(e) if self.failed is not None else None
+    with self.lock:
+      if job.key is not None: self.pending.pop(job.key, None)
+      tickets = list(job.tickets)
+    for ticket in tickets:
+      if ticket.callback is not None and not ticket.cancelled:
+        self.dispatch(self.deliver(ticket, result))
+
+  def deliver(self, ticket, result):
+    def f():
+      with self.lock:
+        if ticket.slot is not None and self.slots.get(ticket.slot, None) is ticket:
+          del self.slots[ticket.slot]
+      if not ticket.cancelled: ticket.callback(result)
+    return f
@@ -0,0 +1,112 @@
+# encoding=utf8
+
+import collections
+import threading
+import time
+
+# Queries sent while typing or hovering, which are dropped rather than
+# queued up while a server is not responding
+INTERACTIVE = ("completions", "type", "documentation", "definition")
+# Timeouts are this multiple of the 95th percentile of recent latencies
+TIMEOUT_FACTOR = 4
+# (default, minimum, maximum) timeouts in seconds, for interactive queries
+# and for the others (uploads, references, renames)
+INTERACTIVE_TIMEOUTS = (2, 1, 5)
+BACKGROUND_TIMEOUTS = (10, 2, 60)
+# Latencies needed before they are used to pick a timeout
+MIN_SAMPLES = 5
+# Failures in a row after which interactive queries are paused
+FAILURE_THRESHOLD = 3
+# Seconds the first pause lasts; it doubles up to the maximum while the
+# server keeps failing
+COOL_DOWN = 5
+MAX_COOL_DOWN = 60
+
+
+class ServerHealth(object):
+  """Latencies and failures of a project's server.
+
+  Request timeouts follow the recent latencies of each query type. After
+  `FAILURE_THRESHOLD` failures in a row, interactive queries are refused
+  until a cool-down has passed. A single query is then let through to
+  try the server; its failure starts a longer cool-down, and any success
+  ends the pause. Safe to use from several threads.
+  """
+
+  def __init__(self, window=50):
+    self.lock = threading.Lock()
+    self.window = window
+    self.latencies = {}
+    self.failures = 0
+    self.paused_until = 0
+    self.cool_down = COOL_DOWN
+    self.trying = False
+
+  def add_latency(self, type, seconds):
+    samples = self.latencies.get(type, None)
+    if samples is None: samples = self.latencies[type] = collections.deque(maxlen=self.window)
+    samples.append(seconds)
+
+  def timeout(self, type):
+    """The timeout, in seconds, for a query of `type`."""
+
+    default, low, high = INTERACTIVE_TIMEOUTS if type in INTERACTIVE else BACKGROUND_TIMEOUTS
+    with self.lock:
+      samples = sorted(self.latencies.get(type, ()))
+    if len(samples) < MIN_SAMPLES: return default
+    p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+    return min(high, max(low, p95 * TIMEOUT_FACTOR))
+
+  def allow(self, type):
+    """Whether a query of `type` may be sent now."""
+
+    if type not in INTERACTIVE: return True
+    with self.lock:
+      if self.failures < FAILURE_THRESHOLD: return True
+      now = time.time()
+      if now < self.paused_until: return False
+      # Let this one try the server, and hold back the others meanwhile
+      self.paused_until = now + self.cool_down
+      self.trying = True
+      return True
+
+  def succeeded(self, type, seconds=None):
+    with self.lock:
+      if seconds is not None: self.add_latency(type, seconds)
+      self.failures = 0
+      self.paused_until = 0
+      self.cool_down = COOL_DOWN
+      self.trying = False
+
+  def failed(self, type, timeout=None):
+    """Record a failed query, which took longer than `timeout` seconds
+    when given.
+
+    Returns the length of the pause when this failure starts one, else
+    None.
+    """
+
+    with self.lock:
+      # A timed out query took at least that long
+      if timeout is not None: self.add_latency(type, timeout)
+      self.failures += 1
+      if self.failures < FAILURE_THRESHOLD: return None
+      now = time.time()
+      if self.failures > FAILURE_THRESHOLD:
+        # Other failures during a pause do not extend it
+        if not self.trying and now < self.paused_until: return None
+        self.cool_down = min(MAX_COOL_DOWN, self.cool_down * 2)
+      self.trying = False
+      self.paused_until = now + self.cool_down
+      return self.cool_down
+
+  def describe(self):
+    """A one-line summary of the timeouts in use and of any pause."""
+
+    with self.lock:
+      types = sorted(self.latencies.keys())
+      paused = self.paused_until - time.time() if self.failures >= FAILURE_THRESHOLD else 0
+    parts = ["%s %.1fs" % (type, self.timeout(type)) for type in types]
+    line = "timeouts: " + (", ".join(parts) or "default")
+    if paused > 0: line += "; queries paused for %ds" % paused
+    return line
@@ -0,0 +1,43 @@
+# encoding=utf8
+
+
+class LRUCache(object):
+  """A dictionary holding at most `size` entries, dropping the least
+  recently used ones when it grows past that."""
+
+  def __init__(self, size):
+    self.size = size
+    self.entries = {}
+    self.tick = 0
+
+  def __len__(self):
+    return len(self.entries)
+
+  def __contains__(self, key):
+    return key in self.entries
+
+  def get(self, key, default=None):
+    entry = self.entries.get(key, None)
+    if entry is None: return default
+    self.tick += 1
+    entry[1] = self.tick
+    return entry[0]
+
+  def put(self, key, value):
+    self.tick += 1
+    self.entries[key] = [value, self.tick]
+    if len(self.entries) > self.size:
+      # Evict a quarter at a time, so that eviction cost is amortized
+      by_age = sorted(self.entries.items(), key=lambda item: item[1][1])
+      for key, _ in by_age[:max(1, self.size // 4)]:
+        del self.entries[key]
+
+  def pop(self, key, default=None):
+    entry = self.entries.pop(key, None)
+    return default if entry is None else entry[0]
+
+  def clear(self):
+    self.entries.clear()
+
+  def keys(self):
+    return list(self.entries.keys())
@@ -28,8 +28,7 @@ def get_message_from_ftype(ftype, argpos):
     msg += "\n\n" + format_doc(ftype['doc'])
   return msg
 
-def get_html_message_from_ftype(ftype, argpos):
-  style = '''
+STYLE = '''
     <style>
       .hint-popup {
         padding-top: 10px;
@@ -57,6 +56,7 @@ def get_html_message_from_ftype(ftype, argpos):
     </style>
   '''
 
+def get_html_message_from_ftype(ftype, argpos):
   func_signature = '<span class="func-name">{func_name}</span>('.format(func_name=ftype["name"])
   i = 0
   for name, type in ftype["args"]:
@@ -85,7 +85,7 @@ def get_html_message_from_ftype(ftype, argpos):
   if doc: doc = doc.replace("\n", "<br>")
 
   template_data = {
-    'style': style,
+    'style': STYLE,
     'func_signature': hint_line(func_signature),
     'doc_link': hint_line(link(ftype['url'], '[docs]')),
     'doc': hint_line(doc)
@@ -151,13 +151,25 @@ class RendererBase(object):
 
   __metaclass__ = abc.ABCMeta
 
+  # The (view id, function type, message) of the argument hint last shown
+  _shown = None
+
   @abc.abstractmethod
-  def _render_impl(self, pfile, view, message):
+  def _render_impl(self, pfile, view, message, update=False):
     """Render the message.
 
-    Implement this to define how subclasses render the message.
+    Implement this to define how subclasses render the message. `update`
+    is true when it replaces an argument hint for the same call.
     """
 
+  def _is_visible(self, view):
+    """Whether rendered content is known to be still visible.
+
+    Override this where it can be checked; content that might be gone,
+    like an expired status message, is rendered again.
+    """
+    return False
+
   def _clean_impl(self, pfile, view):
     """Clean rendered content.
 
@@ -165,30 +177,46 @@ class RendererBase(object):
     """
     pass
 
-  def _render_message(self, pfile, view, message):
-    self._render_impl(pfile, view, message)
+  def _render_message(self, pfile, view, message, update=False):
+    self._render_impl(pfile, view, message, update)
     pfile.showing_arguments = True
 
   def render_arghints(self, pfile, view, ftype, argpos):
-    """Render argument hints."""
+    """Render argument hints.
 
-    if self.useHTML:
-      message = get_html_message_from_ftype(ftype, argpos)
-    else:
-      message = get_message_from_ftype(ftype, argpos)
-    self._render_message(pfile, view, message)
+    Messages are kept on `ftype` per argument position, and nothing is
+    rendered when the same message is known to be still showing.
+    """
+
+    messages = ftype.setdefault("messages", {})
+    key = (self.useHTML, argpos)
+    message = messages.get(key, None)
+    if message is None:
+      if self.useHTML:
+        message = get_html_message_from_ftype(ftype, argpos)
+      else:
+        message = get_message_from_ftype(ftype, argpos)
+      messages[key] = message
+
+    shown = self._shown if pfile.showing_arguments and self._is_visible(view) else None
+    update = shown is not None and shown[0] == view.id() and shown[1] is ftype
+    if update and shown[2] == message: return
+    self._render_message(pfile, view, message, update)
+    self._shown = (view.id(), ftype, message)
 
   def render_description(self, pfile, view, type, doc=None, url=None):
     """Render description."""
 
     message = get_description_message(self.useHTML, type, doc, url)
     self._render_message(pfile, view, message)
+    self._shown = None
 
   def clean(self, pfile, view):
     """Clean rendered content."""
 
     self._clean_impl(pfile, view)
     pfile.showing_arguments = False
+    self._shown = None
 
 
 class TooltipRenderer(RendererBase):
@@ -197,9 +225,15 @@ class TooltipRenderer(RendererBase):
   def __init__(self):
     self.useHTML = True  # Used in RendererBase
 
-  def _render_impl(self, pfile, view, message):
-    view.show_popup(message, sublime.COOPERATE_WITH_AUTO_COMPLETE,
-                    max_width=600, on_navigate=go_to_url)
+  def _render_impl(self, pfile, view, message, update=False):
+    if update:
+      view.update_popup(message)
+    else:
+      view.show_popup(message, sublime.COOPERATE_WITH_AUTO_COMPLETE,
+                      max_width=600, on_navigate=go_to_url)
+
+  def _is_visible(self, view):
+    return view.is_popup_visible()
 
 
 class StatusRenderer(RendererBase):
@@ -208,7 +242,7 @@ class StatusRenderer(RendererBase):
   def __init__(self):
     self.useHTML = False
 
-  def _render_impl(self, pfile, view, message):
+  def _render_impl(self, pfile, view, message, update=False):
     sublime.status_message(message.split('\n')[0])
 
   def _clean_impl(self, pfile, view):
@@ -222,11 +256,17 @@ class PanelRenderer(RendererBase):
   def __init__(self):
     self.useHTML = False
 
-  def _render_impl(self, pfile, view, message):
+  def _render_impl(self, pfile, view, message, update=False):
     panel = view.window().get_output_panel("tern_arghint")
     panel.run_command("tern_arghint", {"msg": message})
     view.window().run_command("show_panel", {"panel": "output.tern_arghint"})
 
+  def _is_visible(self, view):
+    window = view.window()
+    # Sublime Text 2 cannot tell which panel is showing
+    return window is not None and hasattr(window, "active_panel") and \
+      window.active_panel() == "output.tern_arghint"
+
   def _clean_impl(self, pfile, view):
     if pfile.showing_arguments:
       panel = view.window().get_output_panel("tern_arghint")
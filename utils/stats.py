@@ -0,0 +1,132 @@
+# encoding=utf8
+
+import json
+import threading
+import time
+
+# Upper bounds, in milliseconds, of the latency histogram buckets
+BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, float("inf"))
+
+
+class Histogram(object):
+  def __init__(self):
+    self.counts = [0] * len(BUCKETS)
+    self.total = 0.0
+    self.n = 0
+
+  def add(self, ms):
+    for i, bound in enumerate(BUCKETS):
+      if ms <= bound:
+        self.counts[i] += 1
+        break
+    self.total += ms
+    self.n += 1
+
+  def percentile(self, p):
+    """Upper bound of the bucket holding the `p`th percentile."""
+
+    seen = 0
+    for i, count in enumerate(self.counts):
+      seen += count
+      if seen >= self.n * p / 100.0: return BUCKETS[i]
+    return BUCKETS[-1]
+
+  def mean(self):
+    return self.total / self.n if self.n else 0.0
+
+
+class QueryStats(object):
+  def __init__(self):
+    self.build = Histogram()
+    self.connect = Histogram()
+    self.roundtrip = Histogram()
+    self.errors = 0
+    self.bytes_sent = 0
+    self.bytes_received = 0
+
+
+class Stats(object):
+  """Latency, payload and cache counters for Tern requests.
+
+  Recording is a no-op unless `enabled` is set. When `export_path` is set,
+  every request is also appended to that file as a JSON line.
+  """
+
+  def __init__(self):
+    self.enabled = False
+    self.export_path = None
+    self.lock = threading.Lock()
+    self.reset()
+
+  def reset(self):
+    self.queries = {}
+    self.uploads = {"full": 0, "part": 0}
+    self.caches = {}
+    self.since = time.time()
+
+  def query(self, type):
+    stats = self.queries.get(type, None)
+    if stats is None: stats = self.queries[type] = QueryStats()
+    return stats
+
+  def record_build(self, type, seconds):
+    if not self.enabled: return
+    with self.lock:
+      self.query(type).build.add(seconds * 1000)
+
+  def record_request(self, type, uploads, connect, roundtrip, sent, received):
+    if not self.enabled: return
+    with self.lock:
+      stats = self.query(type)
+      stats.connect.add(connect * 1000)
+      stats.roundtrip.add(roundtrip * 1000)
+      stats.bytes_sent += sent
+      stats.bytes_received += received
+      for upload in uploads:
+        if upload in self.uploads: self.uploads[upload] += 1
+    if self.export_path:
+      self.export({"time": time.time(), "type": type, "uploads": uploads,
+                   "connect_ms": connect * 1000, "roundtrip_ms": roundtrip * 1000,
+                   "sent": sent, "received": received})
+
+  def record_error(self, type):
+    if not self.enabled: return
+    with self.lock:
+      self.query(type).errors += 1
+
+  def record_cache(self, name, hit):
+    if not self.enabled: return
+    with self.lock:
+      counts = self.caches.get(name, None)
+      if counts is None: counts = self.caches[name] = [0, 0]
+      counts[0 if hit else 1] += 1
+
+  def export(self, record):
+    try:
+      with open(self.export_path, "a") as f:
+        f.write(json.dumps(record) + "\n")
+    except (IOError, OSError):
+      pass
+
+  def report(self):
+    """Format the collected statistics as text."""
+
+    lines = ["Tern statistics for the last %ds" % (time.time() - self.since), ""]
+    with self.lock:
+      lines.append("%-14s %6s %6s %8s %8s %8s %8s %10s %10s" %
+                   ("query", "count", "errors", "build", "connect", "mean", "p90",
+                    "sent", "received"))
+      for type in sorted(self.queries.keys()):
+        stats = self.queries[type]
+        lines.append("%-14s %6d %6d %6.1fms %6.1fms %6.1fms %6gms %10d %10d" %
+                     (type, stats.roundtrip.n, stats.errors, stats.build.mean(),
+                      stats.connect.mean(), stats.roundtrip.mean(),
+                      stats.roundtrip.percentile(90), stats.bytes_sent,
+                      stats.bytes_received))
+      lines.append("")
+      lines.append("uploads: %d full, %d part" % (self.uploads["full"], self.uploads["part"]))
+      for name in sorted(self.caches.keys()):
+        hits, misses = self.caches[name]
+        lines.append("%s cache: %d hits, %d misses (%.0f%%)" %
+                     (name, hits, misses, 100.0 * hits / max(1, hits + misses)))
+    return "\n".join(lines)
@@ -0,0 +1,101 @@
+# encoding=utf8
+
+import bisect
+import re
+import threading
+
+# Function, class and variable declarations, methods, and functions
+# assigned to properties or object keys
+DECLARATION = re.compile(
+  r"\b(function)\s*\*?\s*([\w$]+)"
+  r"|\b(class)\s+([\w$]+)"
+  r"|\b(var|let|const)\s+([\w$]+)"
+  r"|^[ \t]*(?:(?:static|async|get|set)\s+|\*\s*)*(?!(?:if|for|while|switch|catch|with|function|return)\b)([\w$]+)\s*\([^()\n]*\)\s*\{"
+  r"|([\w$]+)\s*[:=]\s*(?:async\s+)?(?:function\b|\([^()\n]*\)\s*=>|[\w$]+\s*=>)", re.M)
+
+
+def scan_declarations(text):
+  """Find the declarations in a JavaScript text.
+
+  Returns `(name, kind, line, column)` tuples.
+  """
+
+  found, line, line_start, pos = ([], 0, 0, 0)
+  for m in DECLARATION.finditer(text):
+    start = m.start()
+    nl = text.count("\n", pos, start)
+    if nl:
+      line += nl
+      line_start = text.rfind("\n", pos, start) + 1
+    pos = start
+    groups = m.groups()
+    if groups[0]: name, kind, at = (groups[1], "function", m.start(2))
+    elif groups[2]: name, kind, at = (groups[3], "class", m.start(4))
+    elif groups[4]: name, kind, at = (groups[5], groups[4], m.start(6))
+    elif groups[6]: name, kind, at = (groups[6], "method", m.start(7))
+    else: name, kind, at = (groups[7], "function", m.start(8))
+    found.append((name, kind, line, at - line_start))
+  return found
+
+
+class SymbolIndex(object):
+  """The declarations of a project's files, looked up by name.
+
+  Files are indexed and replaced as a whole. The sorted name list used
+  for lookups is rebuilt on the first lookup after a change. Safe to use
+  from several threads.
+  """
+
+  def __init__(self):
+    self.lock = threading.Lock()
+    self.files = {}
+    self.sorted = None
+    self.building = False
+    self.built = False
+
+  def update_file(self, name, text):
+    symbols = scan_declarations(text)
+    with self.lock:
+      self.files[name] = symbols
+      self.sorted = None
+
+  def remove_file(self, name):
+    with self.lock:
+      if self.files.pop(name, None) is not None: self.sorted = None
+
+  def has_file(self, name):
+    with self.lock:
+      return name in self.files
+
+  def entries(self):
+    """All `(lowercased name, name, kind, file, line, column)` entries, sorted."""
+
+    with self.lock:
+      if self.sorted is None:
+        entries = []
+        for file, symbols in self.files.items():
+          for name, kind, line, col in symbols:
+            entries.append((name.lower(), name, kind, file, line, col))
+        entries.sort()
+        self.sorted = entries
+      return self.sorted
+
+  def search(self, query, limit=1000):
+    """Symbols whose name starts with `query`, followed by those that
+    contain its characters in order, ignoring case. Returns at most
+    `limit` entries."""
+
+    entries, query = (self.entries(), query.lower())
+    if not query: return entries[:limit]
+    lo = bisect.bisect_left(entries, (query,))
+    found = []
+    for entry in entries[lo:]:
+      if not entry[0].startswith(query) or len(found) == limit: break
+      found.append(entry)
+    if len(found) < limit:
+      fuzzy = re.compile(".*?".join(re.escape(ch) for ch in query))
+      for entry in entries:
+        if fuzzy.search(entry[0]) and not entry[0].startswith(query):
+          found.append(entry)
+          if len(found) == limit: break
+    return found
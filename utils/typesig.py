@@ -0,0 +1,75 @@
+# encoding=utf8
+
+import re
+
+from .lru import LRUCache
+
+ARG_NAME = re.compile("[\\w_$]+$")
+
+
+class Signature(object):
+  """A parsed Tern type string.
+
+  For function types (`fn(a: number) -> string`), `args` holds the
+  `(name, type)` pairs, with "?" for unnamed arguments, `arg_names` the
+  names used for argument completion, and `retval` the return type, if
+  any. `memo` is free for callers to store values derived from the type.
+  """
+
+  __slots__ = ("type", "is_fn", "args", "arg_names", "retval", "memo")
+
+  def __init__(self, type):
+    self.type = type
+    self.is_fn = False
+    self.args = []
+    self.arg_names = []
+    self.retval = None
+    self.memo = {}
+
+
+def parse_signature(type):
+  """Parse a Tern type string into a Signature."""
+
+  sig = Signature(type)
+  if not type.startswith("fn("): return sig
+  sig.is_fn = True
+  pos, end = (3, len(type))
+  while pos < end and type[pos] != ")":
+    arg_start, colon, depth = (pos, -1, 0)
+    while pos < end:
+      ch = type[pos]
+      if ch == "(" or ch == "[" or ch == "{":
+        depth += 1
+      elif ch == ")" or ch == "]" or ch == "}":
+        if depth > 0: depth -= 1
+        else: break
+      elif depth == 0:
+        if ch == ",": break
+        if ch == ":" and colon == -1: colon = pos
+      pos += 1
+    text = type[arg_start:pos]
+    name, arg_type = ("?", text)
+    if colon != -1:
+      raw_name = type[arg_start:colon]
+      if ARG_NAME.match(raw_name):
+        name, arg_type = (raw_name, type[colon + 2:pos])
+      sig.arg_names.append(raw_name)
+    else:
+      sig.arg_names.append(text.rsplit(" ", 1)[-1])
+    sig.args.append((name, arg_type))
+    if pos < end and type[pos] == ",": pos += 2
+  if type[pos:pos + 5] == ") -> ":
+    sig.retval = type[pos + 5:]
+  return sig
+
+
+cache = LRUCache(2000)
+
+def parse_type(type):
+  """Parse a Tern type string, reusing earlier results for the same string."""
+
+  sig = cache.get(type)
+  if sig is None:
+    sig = parse_signature(type)
+    cache.put(type, sig)
+  return sig